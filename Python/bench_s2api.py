@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmarks for s2api.py against s2api_mock_server.py, reporting throughput,
+per-request latency percentiles and peak Python memory for the main read, write, search
+and order paths. No keys or network access needed.
+
+    python bench_s2api.py --series 5000 --periods 200
+    python bench_s2api.py --save baseline.json
+    python bench_s2api.py --compare baseline.json      # exit code 1 on a regression
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+import s2api
+
+def serve(series:int, periods:int, solve_seconds:float, extra:list=[]):
+    # starts the mock server in its own process so that it does not compete with the client for the GIL
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 's2api_mock_server.py')
+    cmd = [sys.executable, script, '--port', '0', '--series', str(series), '--periods', str(periods), '--solve-seconds', str(solve_seconds)] + extra
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    base_uri = proc.stdout.readline().split()[-1]
+    project_id, scenarios = proc.stdout.readline().strip()[len('project '):].split(': ')
+    aliases = dict([x.split('=') for x in scenarios.split(', ')])
+    return proc, base_uri, project_id, aliases
+
+def _timed(fn, repeat:int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        units = fn()
+        times.append(time.perf_counter() - start)
+    return times, units
+
+def _peak_mb(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+def run(name:str, fn, repeat:int, api, memory:bool=True, expected:int=None):
+    # fn returns the number of units (series, records, orders) it processed; with expected,
+    # units short of it are reported as missing (data lost, not just slow)
+    latencies = []
+    hook = api.add_hook(lambda event: latencies.append(event.elapsed))
+    try:
+        fn()
+        # percentiles over the requests of every timed repeat, not just the last one
+        latencies.clear()
+        times, units = _timed(fn, repeat)
+        p = np.percentile(latencies, [50, 95, 99]) * 1000 if len(latencies) > 0 else [np.nan] * 3
+    finally:
+        api.remove_hook(hook)
+    seconds = float(np.median(times))
+    missing = 0 if expected is None else expected - units
+    if missing > 0:
+        print(f'  {name}: {missing} of {expected} units missing', flush=True)
+    return {'benchmark': name, 'units': units, 'missing': missing, 'seconds': seconds, 'throughput': units / seconds, 'requests': len(latencies) / repeat,
+            'p50_ms': p[0], 'p95_ms': p[1], 'p99_ms': p[2], 'peak_mb': _peak_mb(fn) if memory else np.nan}
+
+def benchmarks(api, project_id:str, aliases:dict, args):
+    variables = [f'V{i:06d}_US' for i in range(args.series)]
+    bl = [f'BL.{x}' for x in variables]
+    scenario_id = aliases['BL']
+    dates = pd.period_range('1980Q1', periods=args.periods, freq='Q-DEC')
+    written = variables[:args.write_series]
+    frame = api.get_scenario_frame(project_id, scenario_id, written, dates)
+    counter = [0]
+
+    def read(**kwargs):
+        def fn():
+            data = api.get_series_data(project_id, bl, batch=args.batch, **kwargs)
+            return data[0].shape[1] if kwargs.get('as_frame') else len(data)
+        return fn
+
+    def write():
+        # every run changes every value so that no write comes back 304
+        counter[0] += 1
+        report = api.write_frame(project_id, scenario_id, frame + counter[0], workers=args.workers)
+        return len(report)
+
+    def apply():
+        # one column in a hundred changes
+        counter[0] += 1
+        data = frame.copy()
+        data.iloc[-1, ::100] += counter[0]
+        report = api.apply_frame(project_id, scenario_id, data, push=False)
+        return int(report['written'].sum())
+
+    def search():
+        return sum(1 for _ in api.iter_search_series(project_id, scenario_ids=[scenario_id], page_size=1000, fields=['variableId']))
+
+    def orders():
+        return len(api.wait_for_orders(project_id, api.local_solve(project_id, [scenario_id] * args.orders), sleep=1))
+
+    # (name, fn, units expected or None)
+    return [('get_series_data', read(), args.series),
+            (f'get_series_data workers={args.workers}', read(workers=args.workers), args.series),
+            (f'get_series_data as_frame workers={args.workers}', read(workers=args.workers, as_frame=True), args.series),
+            (f'get_series_data annual workers={args.workers}', read(workers=args.workers, freq=204), args.series),
+            (f'write_frame workers={args.workers}', write, args.write_series),
+            ('apply_frame 1% changed', apply, None),
+            ('iter_search_series', search, args.series),
+            (f'wait_for_orders x{args.orders}', orders, args.orders)]
+
+def compare(results, baseline:str, tolerance:float):
+    before = pd.DataFrame(json.load(open(baseline))).set_index('benchmark')['throughput']
+    ret = results.join(before.rename('baseline'), on='benchmark')
+    ret['change'] = ret['throughput'] / ret['baseline'] - 1
+    ret['regression'] = (ret['change'] < -tolerance) | (ret['missing'] > 0)
+    return ret
+
+def main(argv:list=None):
+    parser = argparse.ArgumentParser(description='Offline benchmarks for s2api.py')
+    parser.add_argument('--series', type=int, default=2000)
+    parser.add_argument('--periods', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--write-series', type=int, default=200)
+    parser.add_argument('--orders', type=int, default=5)
+    parser.add_argument('--solve-seconds', type=float, default=1.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.05, help='share of requests answered 429 in the throttled run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help='skip the extra tracemalloc run per benchmark')
+    parser.add_argument('--only', default=None, help='run benchmarks whose name contains this text')
+    parser.add_argument('--save', default=None, help='write results to this json file')
+    parser.add_argument('--compare', default=None, help='compare throughput with a json file written by --save')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='throughput drop counted as a regression')
+    args = parser.parse_args(argv)
+
+    rows = []
+    proc, base_uri, project_id, aliases = serve(args.series, args.periods, args.solve_seconds)
+    try:
+        with s2api.ScenarioStudioAPI('bench', 'bench', base_uri=base_uri, backoff=0.05) as api:
+            for name, fn, expected in benchmarks(api, project_id, aliases, args):
+                if args.only is None or args.only in name:
+                    print(f'{name} ...', flush=True)
+                    rows.append(run(name, fn, args.repeat, api, not args.no_memory, expected))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    name = f'get_series_data throttled {args.throttle_rate:.0%}'
+    if args.throttle_rate > 0 and (args.only is None or args.only in name):
+        proc, base_uri, project_id, aliases = serve(args.series, args.periods, args.solve_seconds, ['--throttle-rate', str(args.throttle_rate)])
+        try:
+            with s2api.ScenarioStudioAPI('bench', 'bench', base_uri=base_uri, backoff=0.05) as api:
+                bl = [f'BL.V{i:06d}_US' for i in range(args.series)]
+                print(f'{name} ...', flush=True)
+                rows.append(run(name, lambda: len(api.get_series_data(project_id, bl, batch=args.batch, workers=args.workers, retries=2)), args.repeat, api, not args.no_memory, args.series))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    results = pd.DataFrame(rows)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20, 'display.float_format', '{:.3f}'.format):
+        print(results.to_string(index=False))
+        if args.save is not None:
+            results.to_json(args.save, orient='records', indent=1)
+        if args.compare is not None:
+            diff = compare(results, args.compare, args.tolerance)
+            print(diff[['benchmark', 'baseline', 'throughput', 'change', 'missing', 'regression']].to_string(index=False))
+            if diff['regression'].any():
+                sys.exit(1)
+
+if __name__ == '__main__':
+    main()
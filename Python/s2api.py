@@ -12,30 +12,1315 @@ import hashlib
 import requests
 import time
 import pandas as pd
+import numpy as np
 import urllib.parse
+import asyncio
+import concurrent.futures
+import threading
+import random
+import os
+import tempfile
+import email.utils
+import sqlite3
+import zlib
+import re
+import collections
+import copy
+import warnings
+import functools
+import gzip
+import bisect
+import logging
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# API frequency codes -> pandas period frequencies (weekly codes 16-22 are weeks ending Sunday..Saturday)
+_FREQS = {8: 'D', 16: 'W-SUN', 17: 'W-MON', 18: 'W-TUE', 19: 'W-WED', 20: 'W-THU', 21: 'W-FRI', 22: 'W-SAT',
+          128: 'M', 172: 'Q-DEC', 204: 'Y-DEC'}
+_FREQ_CODES = dict([(v, k) for k, v in _FREQS.items()] + [('A-DEC', 204), ('Q', 172), ('Y', 204), ('A', 204), ('W', 16)])
+# periods per year, for annualizing and year-over-year transformations
+_PERIODS_PER_YEAR = {128: 12, 172: 4, 204: 1}
+
+def _pandas_freq(freq:int):
+    return _FREQS.get(freq, 'Q-DEC')
+
+# API integer dates count periods from the one holding this day
+_EPOCH = '1849-12-31'
+
+@functools.lru_cache(maxsize=None)
+def _epoch_ordinal(pandas_freq:str):
+    return pd.Period(_EPOCH, pandas_freq).ordinal
+
+@functools.lru_cache(maxsize=4096)
+def _period(value, pandas_freq:str):
+    # API date strings (startDate, lastHistory) repeat across thousands of series
+    return pd.Period(value, pandas_freq)
+
+@functools.lru_cache(maxsize=256)
+def _shared_period_index(pandas_freq:str, start:int, length:int):
+    return pd.PeriodIndex(pd.arrays.PeriodArray(np.arange(start, start + length, dtype=np.int64), dtype=pd.PeriodDtype(pandas_freq)))
+
+def _period_index(pandas_freq:str, start:int, length:int):
+    # PeriodIndex of `length` periods from ordinal `start`. The ordinals are built once per
+    # (freq, start, length) and shared; each caller gets its own view so setting a name is safe.
+    return _shared_period_index(pandas_freq, start, length).view()
+
+def _dates_int(dates):
+    # PeriodIndex (or list of Periods) -> numpy array of API integer dates
+    dates = pd.PeriodIndex(dates)
+    return dates.asi8 - _epoch_ordinal(dates.freqstr)
+
+def _int_dates(values, freq:int):
+    # API integer dates -> PeriodIndex; evenly spaced runs come from the shared index cache
+    pandas_freq = _pandas_freq(freq)
+    ordinals = np.asarray(values, dtype=np.int64) + _epoch_ordinal(pandas_freq)
+    if len(ordinals) > 0 and (np.diff(ordinals) == 1).all():
+        return _period_index(pandas_freq, int(ordinals[0]), len(ordinals))
+    return pd.PeriodIndex(pd.arrays.PeriodArray(ordinals, dtype=pd.PeriodDtype(pandas_freq)))
+
+def _date_int(d):
+    if type(d) is pd.Period:
+        return d.ordinal - _epoch_ordinal(d.freqstr)
+    elif type(d) is int:
+        return d
+    else:
+        raise Exception('date_to_int only accepts pd.Period or int types')
+
+_MISSING = -3.4028234663852886E+38
+
+def _encode_data(data):
+    # NaN/None -> API missing-value sentinel, as a contiguous float64 array that the
+    # serializer writes straight from its buffer
+    if isinstance(data, (pd.Series, pd.Index)):
+        values = data.to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        values = np.asarray(data, dtype=np.float64)
+    return np.ascontiguousarray(np.where(np.isnan(values), _MISSING, values))
+
+def _api_freq(pandas_freq:str):
+    pandas_freq = pandas_freq.upper()
+    if pandas_freq not in _FREQ_CODES:
+        raise Exception(f'No Scenario Studio frequency for pandas frequency {pandas_freq}')
+    return _FREQ_CODES[pandas_freq]
+
+def _upper_columns(data):
+    return data.rename(columns=lambda x: str(x).upper().strip())
+
+def _changed_cells(data, baseline, tolerance:float=0.0, trim:bool=True):
+    # True where data differs from baseline by more than tolerance (NaN equals NaN). With
+    # trim, the leading and trailing NaNs that will not be written never count as changes.
+    new = _upper_columns(data).to_numpy(dtype=np.float64, na_value=np.nan)
+    old = _upper_columns(baseline).reindex(index=data.index, columns=_upper_columns(data).columns).to_numpy(dtype=np.float64, na_value=np.nan)
+    with np.errstate(invalid='ignore'):
+        same = (np.abs(new - old) <= tolerance) | (np.isnan(new) & np.isnan(old))
+    changed = ~same
+    if trim:
+        valid = ~np.isnan(new)
+        changed &= np.maximum.accumulate(valid, axis=0) & np.maximum.accumulate(valid[::-1], axis=0)[::-1]
+    return changed
+
+def _frame_payloads(data, edit_history:bool=False, trim:bool=True, changed=None, spans:bool=False):
+    # One write payload per column; with trim, leading and trailing NaNs of each column are
+    # dropped. Given a `changed` mask, columns without changes are skipped (status 304) and,
+    # with spans, only the stretch from the first to the last changed period is sent.
+    # Columns with nothing to write get status 0. Returns (mnemonic, payload, skip status).
+    block = data.to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = ~np.isnan(block)
+    n = block.shape[0]
+    if trim:
+        has_data = valid.any(axis=0)
+        first = valid.argmax(axis=0)
+        last = n - valid[::-1].argmax(axis=0)
+    else:
+        has_data = np.ones(block.shape[1], dtype=bool)
+        first = np.zeros(block.shape[1], dtype=np.int64)
+        last = np.full(block.shape[1], n)
+    has_changes = np.ones(block.shape[1], dtype=bool)
+    if changed is not None:
+        has_changes = changed.any(axis=0)
+        if spans:
+            first = changed.argmax(axis=0)
+            last = n - changed[::-1].argmax(axis=0)
+    starts = _date_int(data.index[0]) + first
+    # column-major so that each column's slice is one contiguous buffer
+    encoded = np.asfortranarray(np.where(valid, block, _MISSING))
+    ret = []
+    for j, variable in enumerate(data.columns):
+        variable = str(variable).upper().strip()
+        if not has_data[j]:
+            ret.append((variable, None, 0))
+        elif not has_changes[j]:
+            ret.append((variable, None, 304))
+        else:
+            ret.append((variable, {'startDate': int(starts[j]), 'data': encoded[first[j]:last[j], j], 'historyModified': edit_history}, None))
+    return ret
+
+def _write_report(results:list):
+    # ok: the scenario now holds the data (written, or unchanged); written: a PUT succeeded
+    status = [x for _, x in results]
+    return pd.DataFrame({'status': status, 'ok': [(x == 200) or (x == 304) for x in status], 'written': [x == 200 for x in status]},
+                        index=pd.Index([variable for variable, _ in results], name='mnemonic'))
+
+def _series_from_obj(series_obj:dict, dates=None):
+    pandas_freq = _pandas_freq(series_obj['data']['freqCode'])
+    index = _period_index(pandas_freq, _period(series_obj['data']['startDate'],pandas_freq).ordinal, series_obj['data']['periods'])
+    values = np.asarray(series_obj['data']['data'], dtype=np.float64)
+    values[np.abs(values) > 1.7e+38] = np.nan
+    series = pd.Series(values,index)
+    if dates is not None:
+        series = series.reindex(dates)
+    if series_obj['lastHistory'] != "N/A":
+        series.last_hist = _period(series_obj['lastHistory'],pandas_freq)
+    series.description = series_obj['description']
+    series.geo = series_obj['geoCode']
+    series.observed = series_obj['observedAttribute']
+    return series
+
+def _series_dict(series_objs:list, dates=None):
+    ret = {}
+    for series_obj in series_objs:
+        if series_obj['status'].upper().strip() == 'OK':
+            ret[series_obj['mnemonic']] = _series_from_obj(series_obj, dates)
+    return ret
+
+def _frame_from_objs(series_objs:list, dates=None):
+    # one float block on a shared PeriodIndex (columns = mnemonics) plus a metadata table
+    objs = [x for x in series_objs if x['status'].upper().strip() == 'OK']
+    if len(objs) == 0:
+        return pd.DataFrame(index=dates), pd.DataFrame(columns=['last_hist','description','geo','observed'], index=pd.Index([], name='mnemonic'))
+    pandas_freq = _pandas_freq(objs[0]['data']['freqCode'])
+    starts = {}
+    for obj in objs:
+        if obj['data']['freqCode'] != objs[0]['data']['freqCode']:
+            raise Exception('get_series_data with as_frame=True requires all series to share one frequency')
+        if obj['data']['startDate'] not in starts:
+            starts[obj['data']['startDate']] = _period(obj['data']['startDate'],pandas_freq).ordinal
+    first = np.array([starts[x['data']['startDate']] for x in objs], dtype=np.int64)
+    lengths = np.array([x['data']['periods'] for x in objs], dtype=np.int64)
+    origin = first.min()
+    offsets = first - origin
+    block = np.full(((offsets + lengths).max(), len(objs)), np.nan)
+    for j, obj in enumerate(objs):
+        block[offsets[j]:offsets[j]+lengths[j], j] = obj['data']['data']
+    block[np.abs(block) > 1.7e+38] = np.nan
+    index = _period_index(pandas_freq, int(origin), block.shape[0])
+    data = pd.DataFrame(block, index=index, columns=[x['mnemonic'] for x in objs])
+    if dates is not None:
+        data = data.reindex(dates)
+    info = pd.DataFrame({'last_hist': [_period(x['lastHistory'],pandas_freq) if x['lastHistory'] != "N/A" else pd.NaT for x in objs],
+                         'description': [x['description'] for x in objs],
+                         'geo': [x['geoCode'] for x in objs],
+                         'observed': [x['observedAttribute'] for x in objs]},
+                        index=pd.Index(data.columns, name='mnemonic'))
+    return data, info
+
+# conversion methods (the API's integer codes) and the observed attributes that default to them
+_CONVERSION_METHODS = {1: 'first', 2: 'last', 3: 'mean', 4: 'sum', 5: 'max', 6: 'min'}
+_OBSERVED_METHODS = {'AVER': 3, 'SUM': 4, 'BEGIN': 1, 'END': 2, 'HIGH': 5, 'LOW': 6}
+
+def _observed_method(observed:str):
+    observed = str(observed).upper().strip()
+    for prefix, method in _OBSERVED_METHODS.items():
+        if observed.startswith(prefix):
+            return method
+    return 3
+
+def convert_frequency(data, freq:int, observed=None, method:int=0):
+    # Aggregates a DataFrame of levels on a monthly or quarterly PeriodIndex to quarterly or
+    # annual (freq 172/204). Each column is aggregated by its observed attribute (a string,
+    # or a list/Series per column such as the info['observed'] returned with as_frame=True;
+    # default AVERAGED) unless method (1-6, as in the API) overrides it. Target periods that
+    # are not fully covered by data come out NaN.
+    source = _api_freq(data.index.freqstr)
+    if source not in _PERIODS_PER_YEAR or freq not in _PERIODS_PER_YEAR or _PERIODS_PER_YEAR[source] < _PERIODS_PER_YEAR[freq]:
+        raise Exception(f'convert_frequency cannot convert frequency {source} to {freq}')
+    ratio = _PERIODS_PER_YEAR[source] // _PERIODS_PER_YEAR[freq]
+    if ratio == 1:
+        return data.copy()
+    if method:
+        methods = np.full(data.shape[1], method)
+    elif observed is None or isinstance(observed, str):
+        methods = np.full(data.shape[1], _observed_method(observed or 'AVERAGED'))
+    else:
+        if isinstance(observed, pd.Series):
+            observed = observed.reindex(data.columns)
+        methods = np.array([_observed_method(x) for x in observed])
+    ordinals = data.index.asi8
+    target = ordinals // ratio
+    origin = target.min() * ratio
+    n = (target.max() + 1) * ratio - origin
+    block = np.full((n, data.shape[1]), np.nan)
+    block[ordinals - origin] = data.to_numpy(dtype=np.float64, na_value=np.nan)
+    groups = block.reshape(n // ratio, ratio, data.shape[1])
+    out = np.empty((groups.shape[0], data.shape[1]))
+    for code in np.unique(methods):
+        cols = methods == code
+        how = _CONVERSION_METHODS[int(code)]
+        if how == 'first':
+            out[:, cols] = groups[:, 0, cols]
+        elif how == 'last':
+            out[:, cols] = groups[:, -1, cols]
+        else:
+            out[:, cols] = getattr(groups[:, :, cols], how)(axis=1)
+    # first/last must also see a complete period so that partial ends are dropped consistently
+    out[np.isnan(groups).any(axis=1)] = np.nan
+    index = _period_index(_pandas_freq(freq), int(target.min()), groups.shape[0])
+    return pd.DataFrame(out, index=index, columns=data.columns)
+
+_TRANSFORMATIONS = ('level', 'diff', 'pct', 'pct_annualized', 'yoy', 'yoy_diff', 'log')
+
+def transform(data, transformation:str='level', freq:int=None):
+    # Standard transformations of a DataFrame (or Series) of levels, computed on the whole block:
+    #   level, diff (change), pct (% change), pct_annualized (annualized % change),
+    #   yoy (% change from a year ago), yoy_diff (change from a year ago), log
+    # freq defaults to the frequency of the PeriodIndex.
+    if transformation not in _TRANSFORMATIONS:
+        raise Exception(f'transformation must be one of {_TRANSFORMATIONS}')
+    if transformation == 'level':
+        return data.copy()
+    values = data.to_numpy(dtype=np.float64, na_value=np.nan)
+    if freq is None:
+        freq = _api_freq(data.index.freqstr)
+    lag = _PERIODS_PER_YEAR[freq] if transformation in ('yoy', 'yoy_diff') else 1
+    previous = np.full(values.shape, np.nan)
+    previous[lag:] = values[:-lag]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if transformation == 'log':
+            out = np.log(values)
+        elif transformation in ('diff', 'yoy_diff'):
+            out = values - previous
+        elif transformation == 'pct_annualized':
+            out = 100 * (np.power(values / previous, _PERIODS_PER_YEAR[freq]) - 1)
+        else:
+            out = 100 * (values / previous - 1)
+    out[~np.isfinite(out)] = np.nan
+    if isinstance(data, pd.Series):
+        return pd.Series(out, index=data.index, name=data.name)
+    return pd.DataFrame(out, index=data.index, columns=data.columns)
+
+def series_views(data, views:dict, observed=None):
+    # Several views from one download of levels: views maps a name to (freq, transformation),
+    # e.g. {'q_pct': (172, 'pct_annualized'), 'a_yoy': (204, 'yoy')}. Frequency conversions
+    # are computed once and shared between the views that use them.
+    converted = {}
+    ret = {}
+    for name, (freq, transformation) in views.items():
+        if freq not in converted:
+            converted[freq] = convert_frequency(data, freq, observed)
+        ret[name] = transform(converted[freq], transformation, freq)
+    return ret
+
+class ScenarioMatrix:
+    # values[scenario, variable, period] as one float64 array, with the scenario aliases,
+    # variable mnemonics and the shared PeriodIndex that label its axes. Missing series are NaN.
+    def __init__(self, values, scenarios:list, variables:list, index, info=None):
+        self.values = values
+        self.scenarios = scenarios
+        self.variables = variables
+        self.index = index
+        self.info = info
+
+    def frame(self):
+        # periods x (scenario, variable) columns over the same block
+        columns = pd.MultiIndex.from_product([self.scenarios, self.variables], names=['scenario','variable'])
+        return pd.DataFrame(self.values.reshape(-1, len(self.index)).T, index=self.index, columns=columns)
+
+    def scenario(self, alias:str):
+        return pd.DataFrame(self.values[self.scenarios.index(alias.upper().strip())].T, index=self.index, columns=self.variables)
+
+    def variable(self, mnemonic:str):
+        return pd.DataFrame(self.values[:, self.variables.index(mnemonic.upper().strip())].T, index=self.index, columns=self.scenarios)
+
+    def diff(self, alias:str, base:str):
+        # alias minus base for every variable and period
+        a = self.values[self.scenarios.index(alias.upper().strip())]
+        b = self.values[self.scenarios.index(base.upper().strip())]
+        return pd.DataFrame((a - b).T, index=self.index, columns=self.variables)
+
+class ScenarioDiff:
+    # b minus a for every variable and period once both sides sit on one period grid. abs and
+    # rel (relative to |a|, NaN where |a| <= rel_floor) are periods x variables frames; a cell is
+    # changed when |b - a| > tolerance or a value exists on one side only.
+    def __init__(self, a, b, tolerance:float=0.0, rel_floor:float=1e-12):
+        self.a = a
+        self.b = b
+        self.tolerance = tolerance
+        x = a.to_numpy(dtype=np.float64, na_value=np.nan)
+        y = b.to_numpy(dtype=np.float64, na_value=np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            d = y - x
+            rel = np.where(np.abs(x) > rel_floor, d / np.abs(x), np.nan)
+            self.changed = (np.abs(d) > tolerance) | (np.isnan(x) != np.isnan(y))
+        self.abs = pd.DataFrame(d, index=a.index, columns=a.columns)
+        self.rel = pd.DataFrame(rel, index=a.index, columns=a.columns)
+
+    def summary(self):
+        # one row per changed variable, largest absolute change first; max_abs is inf when a
+        # value exists on one side only, so those variables rank first
+        changed = self.changed
+        n = changed.shape[0]
+        size = np.where(changed, np.nan_to_num(np.abs(self.abs.to_numpy()), nan=np.inf), -1.0)
+        rel = np.where(changed, np.abs(self.rel.to_numpy()), np.nan)
+        keep = changed.any(axis=0)
+        at = size.argmax(axis=0)
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            max_rel = np.nanmax(rel, axis=0) if n > 0 else np.full(changed.shape[1], np.nan)
+        ret = pd.DataFrame({'periods': changed.sum(axis=0), 'first': self.a.index[changed.argmax(axis=0)] if n > 0 else pd.NaT,
+                            'last': self.a.index[n - 1 - changed[::-1].argmax(axis=0)] if n > 0 else pd.NaT,
+                            'max_abs': size.max(axis=0) if n > 0 else np.nan, 'max_rel': max_rel,
+                            'max_at': self.a.index[at] if n > 0 else pd.NaT},
+                           index=pd.Index(self.a.columns, name='variable'))[keep]
+        return ret.sort_values(['max_abs', 'periods'], ascending=False)
+
+    def changes(self, top:int=None):
+        # changed cells in long form, largest absolute change first
+        rows, cols = np.nonzero(self.changed)
+        d = self.abs.to_numpy()[rows, cols]
+        order = np.argsort(-np.nan_to_num(np.abs(d), nan=np.inf), kind='stable')[:top]
+        rows, cols = rows[order], cols[order]
+        return pd.DataFrame({'variable': self.a.columns[cols], 'period': self.a.index[rows],
+                             'a': self.a.to_numpy()[rows, cols], 'b': self.b.to_numpy()[rows, cols],
+                             'abs': d[order], 'rel': self.rel.to_numpy()[rows, cols]})
+
+def diff_frames(a, b, tolerance:float=0.0, rel_floor:float=1e-12):
+    # ScenarioDiff of two DataFrames of levels (columns = variables, on PeriodIndexes). A
+    # higher frequency side is converted to the lower one first (averaged, see
+    # convert_frequency); the result covers the union of periods and variables.
+    a = _upper_columns(a)
+    b = _upper_columns(b)
+    fa = _PERIODS_PER_YEAR.get(_api_freq(a.index.freqstr))
+    fb = _PERIODS_PER_YEAR.get(_api_freq(b.index.freqstr))
+    if fa != fb:
+        if fa > fb:
+            a = convert_frequency(a, _api_freq(b.index.freqstr))
+        else:
+            b = convert_frequency(b, _api_freq(a.index.freqstr))
+    index = a.index.union(b.index)
+    columns = a.columns.union(b.columns, sort=False)
+    return ScenarioDiff(a.reindex(index=index, columns=columns), b.reindex(index=index, columns=columns), tolerance, rel_floor)
+
+def _matrix_plan(scenarios:list, variables:list):
+    # unique, upper-cased axes and the alias.MNEMONIC expression for every cell
+    scenarios = list(dict.fromkeys(x.upper().strip() for x in scenarios))
+    variables = list(dict.fromkeys(x.upper().strip() for x in variables))
+    return scenarios, variables, [f'{a}.{v}' for a in scenarios for v in variables]
+
+def _matrix_from_objs(series_objs:list, scenarios:list, variables:list, expressions:list, dates=None):
+    for obj in series_objs:
+        obj['mnemonic'] = obj['mnemonic'].upper().strip()
+    data, info = _frame_from_objs(series_objs, dates)
+    block = data.reindex(columns=expressions).to_numpy(dtype=np.float64)
+    values = np.ascontiguousarray(block.T).reshape(len(scenarios), len(variables), block.shape[0])
+    return ScenarioMatrix(values, scenarios, variables, data.index, info)
+
+class BatchSizer:
+    # Steers the number of series per data-series request toward target_seconds per request
+    # and target_points data points per response (the response size grows with the points),
+    # changing by at most a factor of two per observation and halving after a failure.
+    def __init__(self, size:int=100, min_size:int=1, max_size:int=2000, target_seconds:float=5.0, target_points:int=50000):
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.target_points = target_points
+        self._lock = threading.Lock()
+
+    def observe(self, n:int, seconds:float, points:int):
+        ratio = min(self.target_seconds / max(seconds, 1e-3), self.target_points / max(points, 1))
+        with self._lock:
+            self.size = int(min(self.max_size, max(self.min_size, n * min(2.0, max(0.5, ratio)))))
+
+    def shrink(self, n:int):
+        with self._lock:
+            self.size = max(self.min_size, n // 2)
+
+def _failed_series(series_objs:list, failed:dict):
+    # series the server answered for but could not return
+    for obj in series_objs:
+        if obj['status'].upper().strip() != 'OK':
+            failed[obj['mnemonic']] = obj['status']
+    return failed
+
+def _search_series_payload(scenario_ids:list, geos:list=None, state:int=None, local_state:int=None, query:str="", checked_out:int=None, variable_type:list=None, sharedown:bool=None, custom_series:bool=None, history_edits:bool=None, equation_edits:bool=None):
+    pl = {}
+    pl['query'] = query
+    pl['state'] = state
+    pl['checkedOut'] = checked_out
+    pl['variableType'] = variable_type
+    pl['scenarioId'] = scenario_ids
+    if geos is not None:
+        pl['geographies'] = geos
+    if sharedown is not None:
+        pl['sharedown'] = sharedown
+    if custom_series is not None:
+        pl['customSeries'] = custom_series
+    if history_edits is not None:
+        pl['historyEdits'] = history_edits
+    if equation_edits is not None:
+        pl['equationEdits'] = equation_edits
+    if local_state is not None:
+        pl['localState'] = local_state
+    return pl
+
+def _retry_after(headers, default:float):
+    # Retry-After is either a number of seconds or an HTTP date
+    value = headers.get('Retry-After')
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+class RateLimiter:
+    # Token bucket: `rate` requests per second on average, bursts of up to `burst`.
+    # With a state_file the bucket lives on disk under an exclusive file lock, so every
+    # thread and process on the host that points at the same file shares one quota.
+    def __init__(self, rate:float=5.0, burst:int=10, state_file:str=None):
+        self.rate = rate
+        self.burst = burst
+        self._state_file = state_file
+        self._lock = threading.Lock()
+        self._state = {'tokens': float(burst), 'updated': time.time(), 'blocked_until': 0.0}
+
+    @classmethod
+    def for_key(cls, acc_key:str, rate:float=5.0, burst:int=10):
+        # the API throttles per access key, so processes using the same key share a file
+        name = hashlib.sha256(acc_key.encode('utf-8')).hexdigest()[:16]
+        return cls(rate, burst, os.path.join(tempfile.gettempdir(), f's2api-{name}.ratelimit'))
+
+    def _update(self, fn):
+        with self._lock:
+            if self._state_file is None:
+                return fn(self._state)
+            with open(self._state_file, 'a+') as f:
+                f.seek(0)
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                else:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    f.seek(0)
+                    text = f.read()
+                    state = json.loads(text) if len(text) > 0 else dict(self._state)
+                    ret = fn(state)
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+                    else:
+                        f.seek(0)
+                        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                return ret
+
+    def reserve(self):
+        # takes a token and returns 0, or returns the seconds to wait before trying again
+        def take(state):
+            now = time.time()
+            state['tokens'] = min(float(self.burst), state['tokens'] + (now - state['updated']) * self.rate)
+            state['updated'] = now
+            if now < state['blocked_until']:
+                return state['blocked_until'] - now
+            if state['tokens'] >= 1.0:
+                state['tokens'] -= 1.0
+                return 0.0
+            return (1.0 - state['tokens']) / self.rate
+        return self._update(take)
+
+    def acquire(self):
+        wait = self.reserve()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.reserve()
+
+    def penalize(self, delay:float):
+        # after a 429 every holder of the bucket pauses for `delay` seconds
+        def block(state):
+            state['tokens'] = 0.0
+            state['updated'] = time.time()
+            state['blocked_until'] = max(state['blocked_until'], state['updated'] + delay)
+        self._update(block)
+
+    async def _off_loop(self, fn, *args):
+        # the shared file is read under a blocking lock, so it is taken on a worker thread
+        if self._state_file is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def acquire_async(self):
+        # acquire() for the event loop: waits with asyncio.sleep instead of blocking it
+        wait = await self._off_loop(self.reserve)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = await self._off_loop(self.reserve)
+
+    async def penalize_async(self, delay:float):
+        await self._off_loop(self.penalize, delay)
+
+class TokenManager:
+    # Holds the OAuth token and its expiry. A token is treated as expired `refresh_margin`
+    # seconds early so it is renewed before the server rejects it. With a cache_file the
+    # token is shared with later processes through a file readable only by its owner.
+    def __init__(self, acc_key:str, refresh_margin:float=60.0, cache_file:str=None):
+        self._key = hashlib.sha256(acc_key.encode('utf-8')).hexdigest()
+        self.refresh_margin = refresh_margin
+        self._cache_file = cache_file
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+        self._rejected = None
+        self._load()
+
+    def _load(self):
+        if self._cache_file is None or not os.path.exists(self._cache_file):
+            return
+        try:
+            with open(self._cache_file) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return
+        if cached.get('key') == self._key and cached.get('token') != self._rejected:
+            self._token = cached['token']
+            self._expires_at = cached['expires_at']
+
+    def _save(self):
+        if self._cache_file is None:
+            return
+        tmp = f'{self._cache_file}.{os.getpid()}.tmp'
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'key': self._key, 'token': self._token, 'expires_at': self._expires_at}, f)
+        os.replace(tmp, self._cache_file)
+
+    def current(self):
+        # the token if it is still good for at least refresh_margin seconds, otherwise None
+        if self._token is None or time.time() >= self._expires_at - self.refresh_margin:
+            self._load()
+        if self._token is not None and time.time() < self._expires_at - self.refresh_margin:
+            return self._token
+        return None
+
+    def set(self, token:str, expires_in:float):
+        self._token = token
+        self._expires_at = time.time() + expires_in
+        self._save()
+
+    def get(self, fetch):
+        # fetch() returns (token, expires_in); concurrent callers share a single refresh
+        token = self.current()
+        if token is None:
+            with self._lock:
+                token = self.current()
+                if token is None:
+                    token, expires_in = fetch()
+                    self.set(token, expires_in)
+        return token
+
+    def invalidate(self, stale:str):
+        # after a 401; a token that was already replaced by another caller is kept
+        with self._lock:
+            self._rejected = stale
+            if self._token == stale:
+                self._token = None
+                self._expires_at = 0.0
+
+def _backoff_delay(tries:int, backoff:float, max_backoff:float):
+    # exponential backoff with jitter in [delay/2, delay]
+    delay = min(max_backoff, backoff * 2 ** (tries - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def _is_retryable(status:int):
+    return status == 0 or status == 408 or status >= 500
+
+def _batch_action(status:int, size:int, oauth:bool):
+    # what to do with a data-series batch that failed with `status`: throttling, connection
+    # errors and a renewed OAuth token are retried as they are; timeouts, 413 and 5xx are
+    # retried in two halves (single series as they are); other client errors fail at once
+    if status in (0, 429) or (status == 401 and oauth):
+        return 'retry'
+    if status in (408, 413) or status >= 500:
+        return 'split' if size > 1 else 'retry'
+    return 'fail'
+
+def _warn_failed(failed:dict, total:int):
+    # series lost to HTTP errors when the caller did not ask for a report
+    if len(failed) > 0:
+        reasons = ', '.join(sorted(set(failed.values())))
+        warnings.warn(f'{len(failed)} of {total} series could not be downloaded ({reasons}); use report=True to get them', stacklevel=3)
+
+def _order_list(orders):
+    # orders as returned by solve and build calls: a list of order dicts, or a single one
+    if type(orders) is dict:
+        orders = [orders]
+    if type(orders) is not list:
+        raise ValueError(f'expected a list of orders, got {orders!r}')
+    for o in orders:
+        if type(o) is not dict or 'orderId' not in o:
+            raise ValueError(f'not an order (no orderId): {o!r}')
+    return orders
+
+def _order_read(status):
+    # a status poll that returned an order (finished or not) rather than an error
+    return type(status) is dict and 'finished' in status
+
+class OrderTracker:
+    # Polls every outstanding order from one background thread. Each order starts at
+    # min_interval and backs off by `growth` up to max_interval while it is unfinished, so
+    # quick solves return promptly and long ones cost few requests. track() returns one
+    # concurrent.futures.Future per order, resolved with the final order status. An order whose
+    # status cannot be read max_failures polls in a row (bad orderId, lost access) fails its future.
+    def __init__(self, api, min_interval:float=1.0, max_interval:float=30.0, growth:float=1.5, workers:int=8, max_failures:int=3):
+        self._api = api
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.growth = growth
+        self.max_failures = max_failures
+        self._pending = {}
+        self._futures = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join()
+        self._pool.shutdown()
+        for future in self._futures.values():
+            future.cancel()
+
+    def track(self, project_id:str, orders:list, build:bool=False, callback=None):
+        # callback(status) is called from the tracker thread when an order finishes
+        futures = []
+        with self._cond:
+            if self._closed:
+                raise Exception('OrderTracker is closed')
+            for o in _order_list(orders):
+                orderId = o['orderId']
+                if orderId not in self._futures:
+                    self._futures[orderId] = concurrent.futures.Future()
+                    self._pending[orderId] = {'project_id': project_id, 'build': build, 'interval': self.min_interval, 'due': time.monotonic(), 'failures': 0}
+                future = self._futures[orderId]
+                if callback is not None:
+                    future.add_done_callback(lambda f: None if f.cancelled() or f.exception() is not None else callback(f.result()))
+                futures.append(future)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return futures
+
+    def future(self, orderId:str):
+        return self._futures[orderId]
+
+    def _poll(self, item):
+        orderId, order = item
+        try:
+            return self._api.order_status(order['project_id'], orderId, order['build']), None
+        except Exception as ex:
+            return None, ex
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._closed or len(self._pending) == 0:
+                    self._thread = None
+                    return
+                now = time.monotonic()
+                due = [(k, v) for k, v in self._pending.items() if v['due'] <= now]
+                if len(due) == 0:
+                    self._cond.wait(min(v['due'] for v in self._pending.values()) - now)
+                    continue
+            results = list(self._pool.map(self._poll, due))
+            done = []
+            with self._cond:
+                for (orderId, order), (status, ex) in zip(due, results):
+                    if ex is None and not _order_read(status):
+                        order['failures'] += 1
+                        if order['failures'] >= self.max_failures:
+                            ex = Exception(f'status of order {orderId} could not be read {order["failures"]} times: {status}')
+                    elif ex is None:
+                        order['failures'] = 0
+                    if ex is not None or status.get('finished'):
+                        del self._pending[orderId]
+                        done.append((self._futures[orderId], status, ex))
+                    else:
+                        order['interval'] = min(self.max_interval, order['interval'] * self.growth)
+                        order['due'] = time.monotonic() + order['interval']
+            for future, status, ex in done:
+                if ex is not None:
+                    future.set_exception(ex)
+                else:
+                    future.set_result(status)
+
+    def as_completed(self, futures:list=None, timeout:float=None):
+        # yields final order statuses in the order the orders finish
+        if futures is None:
+            futures = list(self._futures.values())
+        for future in concurrent.futures.as_completed(futures, timeout):
+            yield future.result()
+
+    def wait(self, futures:list=None, timeout:float=None):
+        # final statuses in the order given; raises concurrent.futures.TimeoutError after `timeout` seconds overall
+        if futures is None:
+            futures = list(self._futures.values())
+        deadline = None if timeout is None else time.monotonic() + timeout
+        return [f.result(None if deadline is None else max(0.0, deadline - time.monotonic())) for f in futures]
+
+def _compact_record(fields:list):
+    # records as namedtuples holding only `fields`, or the raw dicts when fields is None
+    if fields is None:
+        return lambda x: x
+    record = collections.namedtuple('Record', fields, rename=True)
+    return lambda x: record(*[x.get(f) for f in fields])
+
+def _url_scope(url:str):
+    # (project_id, scenario_id) a URL belongs to; either may be None
+    path = urllib.parse.urlparse(url).path
+    m = re.search(r'/project/([^/]+)(?:/(?:scenario|checkpoint)/([^/]+))?', path)
+    if m is not None:
+        return m.group(1), m.group(2)
+    m = re.search(r'/base-scenario/([^/]+)', path)
+    if m is not None:
+        return None, m.group(1)
+    return None, None
+
+# POST endpoints that only read
+_READ_ONLY_POST = re.compile(r'/data-series$|/search(/count|/results)?$|/series/info$')
+
+class MetadataCache:
+    # In-memory cache of GET responses for metadata endpoints. Entries live for `ttl` seconds,
+    # at most max_entries are kept (least recently used dropped first), and every write the
+    # client makes to a project or scenario drops the entries for that project or scenario.
+    def __init__(self, ttl:float=300.0, max_entries:int=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations, 'entries': len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def lookup(self, url:str):
+        # (True, copy of the cached response) or (False, None)
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None and time.monotonic() < entry['expires']:
+                self._entries.move_to_end(url)
+                self.hits += 1
+                return True, copy.deepcopy(entry['value'])
+            self.misses += 1
+            return False, None
+
+    def store(self, url:str, value):
+        project_id, scenario_id = _url_scope(url)
+        with self._lock:
+            self._entries[url] = {'value': copy.deepcopy(value), 'expires': time.monotonic() + self.ttl, 'project': project_id, 'scenario': scenario_id}
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, url:str, fetch):
+        # fetch() returns (status, response); only successful responses are kept
+        found, value = self.lookup(url)
+        if found:
+            return value
+        status, value = fetch()
+        if status == 200:
+            self.store(url, value)
+        return value
+
+    def invalidate(self, project_id:str=None, scenario_id:str=None):
+        # a scenario change also drops the project-level entries (scenario lists, project info)
+        with self._lock:
+            if scenario_id is None:
+                doomed = [k for k, v in self._entries.items() if v['project'] == project_id]
+            else:
+                doomed = [k for k, v in self._entries.items() if v['scenario'] == scenario_id or (v['project'] == project_id and v['scenario'] is None)]
+            for k in doomed:
+                del self._entries[k]
+            self.invalidations += len(doomed)
+
+    def invalidate_url(self, method:str, url:str):
+        verb = method.lower().strip()
+        if verb == 'get' or (verb == 'post' and _READ_ONLY_POST.search(urllib.parse.urlparse(url).path)):
+            return
+        project_id, scenario_id = _url_scope(url)
+        if verb == 'delete':
+            scenario_id = None
+        if project_id is not None or scenario_id is not None:
+            self.invalidate(project_id, scenario_id)
+
+class UserDirectory:
+    # The client user universe indexed by lower-cased email and by sid, reloaded after `ttl` seconds
+    def __init__(self, ttl:float=3600.0):
+        self.ttl = ttl
+        self.users = []
+        self._by_email = {}
+        self._by_sid = {}
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def expired(self):
+        return self._loaded is None or time.monotonic() - self._loaded >= self.ttl
+
+    def load(self, users:list):
+        if type(users) is not list:
+            print('Error - user universe could not be read')
+            return
+        with self._lock:
+            self.users = users
+            self._by_email = {str(x.get('email', '')).lower().strip(): x for x in users}
+            self._by_sid = {str(x.get('sid', '')).lower().strip(): x for x in users}
+            self._loaded = time.monotonic()
+
+    def find(self, user:str):
+        # user is an email address or a sid
+        key = user.lower().strip()
+        return self._by_email.get(key, self._by_sid.get(key))
+
+    def contributors(self, users:list, role:int):
+        # (payload for /contributor/{role}, users that could not be found)
+        pl = []
+        unresolved = []
+        for user in users:
+            found = self.find(user)
+            if found is None:
+                unresolved.append(user)
+            else:
+                pl.append({'sid':found['sid'], 'firstName':found['firstName'], 'lastName':found['lastName'], 'email':found['email'], 'role':role})
+        return pl, unresolved
+
+def _audit_time(record:dict):
+    for key in ('timestamp','created','createdDate','date','auditDate'):
+        if record.get(key) is not None:
+            stamp = pd.Timestamp(record[key])
+            return stamp.tz_convert(None) if stamp.tzinfo is not None else stamp
+    return None
+
+def _audit_scenario(record:dict):
+    for key in ('scenarioId','scenario'):
+        if record.get(key) is not None:
+            return record[key]
+    return None
+
+def _audit_variables(record:dict):
+    # None when the event does not say which variables it touched
+    for key in ('variables','variableIds','variable','variableId','mnemonic'):
+        value = record.get(key)
+        if value:
+            if type(value) is str:
+                value = [value]
+            return [str(x).upper().strip() for x in value]
+    return None
+
+def _audit_params(scenario_ids:list, actions:list):
+    return [f'options.scenarios={x}' for x in scenario_ids] + [f'options.actions={x}' for x in actions]
+
+class AuditCursor:
+    # Where tail_audits stopped reading each project audit log, one entry per project and
+    # filter: how many records were read, the newest timestamp seen and the ids stamped with it.
+    # With a path, the cursor is loaded from and saved to that json file so that a restarted
+    # monitor only reads events it has not seen.
+    def __init__(self, path:str=None):
+        self.path = path
+        self._state = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self._state = json.load(f)
+
+    @staticmethod
+    def key(project_id:str, scenario_ids:list=[], actions:list=[]):
+        return '|'.join([project_id, ','.join(sorted(str(x) for x in scenario_ids)), ','.join(sorted(str(x) for x in actions))])
+
+    def get(self, key:str):
+        return self._state.get(key)
+
+    def set(self, key:str, state:dict):
+        self._state[key] = state
+
+    def reset(self, project_id:str=None):
+        if project_id is None:
+            self._state = {}
+        else:
+            self._state = {k: v for k, v in self._state.items() if k.split('|')[0] != project_id}
+        self.save()
+
+    def save(self):
+        if self.path is not None:
+            _replace_file(self.path, lambda f: f.write(json.dumps(self._state, indent=1).encode()))
+
+class _AuditTail:
+    # cursor bookkeeping for tail_audits, shared by the sync and async clients
+    def __init__(self, cursor:AuditCursor, project_id:str, scenario_ids:list, actions:list, from_start:bool):
+        self.cursor = cursor
+        self.key = cursor.key(project_id, scenario_ids, actions)
+        state = cursor.get(self.key) or {'position': 0 if from_start else None, 'time': None, 'ids': [], 'newest_first': None}
+        self.position = state['position']
+        self.last = None if state['time'] is None else pd.Timestamp(state['time'])
+        self.ids = set(state['ids'])
+        self.newest_first = state['newest_first']
+
+    def start(self, total:int):
+        # number of records added since the previous read
+        if self.position is None:
+            self.position = total
+        elif total < self.position:
+            # the log was trimmed: read it again, records already seen are skipped by time and id
+            self.position = 0
+        return total - self.position
+
+    def order(self, first:list, last:list):
+        # first and last records of the log; the order stays unknown (read as oldest first)
+        # until they carry different timestamps
+        if type(first) is list and type(last) is list and len(first) > 0 and len(last) > 0:
+            a, b = _audit_time(first[0]), _audit_time(last[0])
+            if a is not None and b is not None and a != b:
+                self.newest_first = bool(a > b)
+
+    def seen(self, record:dict):
+        t = _audit_time(record)
+        return self.last is not None and t is not None and (t < self.last or (t == self.last and record.get('id') in self.ids))
+
+    def collect(self, records:list, page:list, new:int):
+        # newest-first pages: keeps the unseen records, True once the read reached seen ones
+        for x in page:
+            if self.seen(x) or (self.last is None and len(records) >= new):
+                return True
+            records.append(x)
+        return False
+
+    def advance(self, record:dict):
+        # moves past record, False when it had been seen already
+        fresh = not self.seen(record)
+        self.position += 1
+        t = _audit_time(record)
+        if t is not None and (self.last is None or t > self.last):
+            self.last = t
+            self.ids = set()
+        if t is not None and t == self.last:
+            self.ids.add(record.get('id'))
+        return fresh
+
+    def save(self):
+        self.cursor.set(self.key, {'position': self.position, 'time': None if self.last is None else self.last.isoformat(),
+                                   'ids': sorted(self.ids, key=str), 'newest_first': self.newest_first})
+        self.cursor.save()
+
+# path segments that name an object, and what to call the segment that follows them
+_ENDPOINT_IDS = {'project': '{project_id}', 'scenario': '{scenario_id}', 'base-scenario': '{scenario_id}', 'checkpoint': '{scenario_id}',
+                 'order': '{order_id}', 'data-series': '{variable}', 'series': '{variable}', 'variable': '{variable}',
+                 'historical': '{date}', 'contributor': '{role}', 'alias': '{alias}'}
+_ENDPOINT_WORDS = {'create', 'search', 'clone', 'copy', 'alias', 'add-factor', 'checkin', 'checkout', 'commit', 'custom', 'endogenizeBulk',
+                   'exogenize', 'exogenize-through', 'reendogenize', 'checked-out'}
+
+def _endpoint_template(url:str, base_uri:str=''):
+    # '/project/{project_id}/scenario/{scenario_id}/data-series/{variable}/data/local' for any project, scenario and variable
+    path = urllib.parse.urlsplit(url).path
+    root = urllib.parse.urlsplit(base_uri).path.rstrip('/')
+    if len(root) > 0 and path.startswith(root):
+        path = path[len(root):]
+    parts = path.strip('/').split('/')
+    for i in range(1, len(parts)):
+        if parts[i-1] in _ENDPOINT_IDS and parts[i] not in _ENDPOINT_WORDS:
+            parts[i] = _ENDPOINT_IDS[parts[i-1]]
+    return '/' + '/'.join(parts)
+
+class RequestEvent:
+    # One API call as reported to request hooks, covering every try. Times are in seconds:
+    # server runs from sending a request to its response headers (including connection setup
+    # when the pool has to open one), download reads the body, parse decodes it and wait is
+    # the rest of elapsed (rate limiting, backoff, token refresh). bytes_in counts wire bytes.
+    def __init__(self, method:str, url:str, endpoint:str):
+        self.method = method.upper()
+        self.url = url
+        self.endpoint = endpoint
+        self.status = 0
+        self.tries = 0
+        self.errors = 0
+        self.throttled = 0
+        self.unauthorized = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.server = 0.0
+        self.download = 0.0
+        self.parse = 0.0
+        self.elapsed = 0.0
+        self.started = time.perf_counter()
+
+    @property
+    def retries(self):
+        return max(0, self.tries - 1)
+
+    @property
+    def wait(self):
+        return max(0.0, self.elapsed - self.server - self.download - self.parse)
+
+    def _emit(self, hooks:list, status:int):
+        self.status = status
+        self.elapsed = time.perf_counter() - self.started
+        for hook in hooks:
+            hook(self)
+
+    def __repr__(self):
+        return (f'{self.method} {self.endpoint} {self.status} tries={self.tries} elapsed={self.elapsed:.3f}s '
+                f'(server {self.server:.3f}, download {self.download:.3f}, parse {self.parse:.3f}, wait {self.wait:.3f}) '
+                f'out={self.bytes_out}B in={self.bytes_in}B')
+
+def _prometheus_labels(labels:dict):
+    return ','.join([f'{k}="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' for k, v in labels.items()])
+
+class RequestMetrics:
+    # Request hook that aggregates events per (method, endpoint): statuses, tries, 429/401
+    # counts, bytes and a latency histogram over `buckets` (upper bounds in seconds).
+    # summary() gives a DataFrame, prometheus() the text exposition format, log() one line per endpoint.
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+    def __init__(self, buckets:tuple=None):
+        self.buckets = tuple(sorted(self.BUCKETS if buckets is None else buckets))
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event:RequestEvent):
+        key = (event.method, event.endpoint)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = {'count': 0, 'tries': 0, 'throttled': 0, 'unauthorized': 0, 'errors': 0, 'bytes_in': 0, 'bytes_out': 0,
+                         'elapsed': 0.0, 'server': 0.0, 'download': 0.0, 'parse': 0.0, 'wait': 0.0,
+                         'status': collections.Counter(), 'histogram': [0] * (len(self.buckets) + 1)}
+                self._stats[key] = stats
+            stats['count'] += 1
+            for name in ('tries', 'throttled', 'unauthorized', 'errors', 'bytes_in', 'bytes_out', 'elapsed', 'server', 'download', 'parse', 'wait'):
+                stats[name] += getattr(event, name)
+            stats['status'][event.status] += 1
+            stats['histogram'][bisect.bisect_left(self.buckets, event.elapsed)] += 1
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def _quantile(self, histogram:list, q:float):
+        # linear interpolation within the bucket holding the q-th observation; the open last bucket reports its lower bound
+        rank = q * sum(histogram)
+        seen = 0
+        for i, n in enumerate(histogram):
+            if n > 0 and seen + n >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i-1] if i > 0 else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return float('nan')
+
+    def summary(self):
+        with self._lock:
+            stats = copy.deepcopy(self._stats)
+        rows = []
+        for (method, endpoint), x in stats.items():
+            n = x['count']
+            rows.append({'method': method, 'endpoint': endpoint, 'count': n, 'ok': x['status'][200] + x['status'][304],
+                         'retries': x['tries'] - n, 'throttled': x['throttled'], 'unauthorized': x['unauthorized'], 'errors': x['errors'],
+                         'bytes_out': x['bytes_out'], 'bytes_in': x['bytes_in'], 'mean': x['elapsed'] / n,
+                         'p50': self._quantile(x['histogram'], 0.5), 'p95': self._quantile(x['histogram'], 0.95), 'p99': self._quantile(x['histogram'], 0.99),
+                         'server': x['server'] / n, 'download': x['download'] / n, 'parse': x['parse'] / n, 'wait': x['wait'] / n})
+        columns = ['method','endpoint','count','ok','retries','throttled','unauthorized','errors','bytes_out','bytes_in','mean','p50','p95','p99','server','download','parse','wait']
+        return pd.DataFrame(rows, columns=columns).set_index(['method','endpoint']).sort_index()
+
+    def prometheus(self, prefix:str='s2api'):
+        with self._lock:
+            stats = copy.deepcopy(self._stats)
+        lines = [f'# HELP {prefix}_request_duration_seconds Scenario Studio API call latency including retries.',
+                 f'# TYPE {prefix}_request_duration_seconds histogram']
+        for (method, endpoint), x in sorted(stats.items()):
+            labels = {'method': method, 'endpoint': endpoint}
+            cumulative = 0
+            for bound, n in zip(list(self.buckets) + ['+Inf'], x['histogram']):
+                cumulative += n
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{{_prometheus_labels(dict(labels, le=bound))}}} {cumulative}')
+            lines.append(f'{prefix}_request_duration_seconds_sum{{{_prometheus_labels(labels)}}} {x["elapsed"]}')
+            lines.append(f'{prefix}_request_duration_seconds_count{{{_prometheus_labels(labels)}}} {x["count"]}')
+        counters = [('requests_total', 'API calls by final status.', None),
+                    ('request_tries_total', 'HTTP attempts, including retries.', 'tries'),
+                    ('throttled_total', 'Responses with status 429.', 'throttled'),
+                    ('unauthorized_total', 'Responses with status 401.', 'unauthorized'),
+                    ('connection_errors_total', 'Attempts that failed without a response.', 'errors'),
+                    ('request_bytes_total', 'Request body bytes sent.', 'bytes_out'),
+                    ('response_bytes_total', 'Response bytes received.', 'bytes_in')]
+        for name, text, field in counters:
+            lines.append(f'# HELP {prefix}_{name} {text}')
+            lines.append(f'# TYPE {prefix}_{name} counter')
+            for (method, endpoint), x in sorted(stats.items()):
+                labels = {'method': method, 'endpoint': endpoint}
+                if field is None:
+                    for status, n in sorted(x['status'].items()):
+                        lines.append(f'{prefix}_{name}{{{_prometheus_labels(dict(labels, status=status))}}} {n}')
+                else:
+                    lines.append(f'{prefix}_{name}{{{_prometheus_labels(labels)}}} {x[field]}')
+        return '\n'.join(lines) + '\n'
+
+    def log(self, logger:logging.Logger=None, level:int=logging.INFO):
+        logger = logging.getLogger('s2api') if logger is None else logger
+        for (method, endpoint), x in self.summary().iterrows():
+            logger.log(level, '%s %s count=%d ok=%d retries=%d 429=%d 401=%d mean=%.3fs p95=%.3fs out=%dB in=%dB',
+                       method, endpoint, x['count'], x['ok'], x['retries'], x['throttled'], x['unauthorized'], x['mean'], x['p95'], x['bytes_out'], x['bytes_in'])
+
+class RequestLogger:
+    # Request hook that logs each call, or with `slow` only calls slower than that many seconds and failures
+    def __init__(self, logger:logging.Logger=None, level:int=logging.INFO, slow:float=None):
+        self.logger = logging.getLogger('s2api') if logger is None else logger
+        self.level = level
+        self.slow = slow
+
+    def __call__(self, event:RequestEvent):
+        failed = (event.status != 200) and (event.status != 304)
+        if failed:
+            self.logger.log(max(self.level, logging.WARNING), '%r', event)
+        elif (self.slow is None) or (event.elapsed >= self.slow):
+            self.logger.log(self.level, '%r', event)
+
+def _json_default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+class JSONSerializer:
+    # Encodes request payloads to bytes and decodes response bytes without going through str.
+    # Uses orjson when it is installed (it also writes NumPy arrays straight from their
+    # buffers) and the json module otherwise. Any object with dumps/loads can replace it.
+    def __init__(self, backend:str=None):
+        if backend is None:
+            backend = 'json' if orjson is None else 'orjson'
+        if backend not in ('json', 'orjson'):
+            raise Exception('JSONSerializer backend must be json or orjson')
+        if backend == 'orjson' and orjson is None:
+            raise ImportError('JSONSerializer(backend="orjson") requires orjson (pip install orjson)')
+        self.backend = backend
+
+    def dumps(self, obj):
+        if self.backend == 'orjson':
+            return orjson.dumps(obj, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+        return json.dumps(obj, default=_json_default, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        if self.backend == 'orjson':
+            return orjson.loads(data)
+        return json.loads(data)
+
+def _encode_body(serializer, payload, compress:bool, compress_min_bytes:int):
+    # request body bytes and any extra headers; bodies of compress_min_bytes or more are gzipped when compress is on
+    if type(payload) is list or type(payload) is dict:
+        body = serializer.dumps(payload)
+    elif type(payload) is str:
+        body = payload.encode('utf-8')
+    else:
+        body = payload
+    if compress and (body is not None) and len(body) >= compress_min_bytes:
+        return gzip.compress(body, compresslevel=6), {'Content-Encoding': 'gzip'}
+    return body, {}
 
 class BaseAPI:
-    def __init__(self,acc_key:str,enc_key:str,oauth:bool = True, proxies={}, debug:bool=False):
+    def __init__(self,acc_key:str,enc_key:str,oauth:bool = True, proxies={}, debug:bool=False, pool_connections:int=10, pool_maxsize:int=10, timeout=(10,300), rate_limiter:RateLimiter=None, backoff:float=1.0, max_backoff:float=60.0, token_cache:str=None, token_refresh_margin:float=60.0, serializer=None, compress:bool=False, compress_min_bytes:int=16384, hooks:list=None):
         self._base_uri = 'https://api.economy.com'
         self._acc_key = acc_key
         self._enc_key = enc_key
-        self._token = 'bearer None'
+        self._tokens = TokenManager(acc_key, token_refresh_margin, token_cache)
         self._oauth = oauth
         self._proxies = proxies
+        # responses arrive gzipped whenever the server supports it; compress also gzips large request bodies
+        self._serializer = JSONSerializer() if serializer is None else serializer
+        self._compress = compress
+        self._compress_min_bytes = compress_min_bytes
         self._debug = debug
+        # timeout is (connect, read) in seconds, or a single number for both
+        self._timeout = timeout
+        # one keep-alive session for the lifetime of the client; pool_connections is the
+        # number of hosts kept in the pool, pool_maxsize the connections kept per host
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._rate_limiter = rate_limiter
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        # callables given a RequestEvent after every API call; nothing is measured while this is empty
+        self.hooks = [] if hooks is None else list(hooks)
+        # HTTP status of the last request() made on each thread
+        self._last = threading.local()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def last_status(self):
+        # status of the last request() on this thread (0: no response), for callers of methods that return only the body
+        return getattr(self._last, 'status', None)
+
+    def close(self):
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
         
     def get_oauth_token(self):
+        return self._fetch_oauth_token()[0]
+
+    def _fetch_oauth_token(self):
         access_key = self._acc_key
         private_key = self._enc_key
         url = f'{self._base_uri}/oauth2/token'
         head = {'Content-Type':'application/x-www-form-urlencoded'}
         data = f'client_id={access_key}&client_secret={private_key}&grant_type=client_credentials'
-        r = requests.post(url=url,headers=head,data=data,proxies=self._proxies)
+        r = self._session.post(url=url,headers=head,data=data,proxies=self._proxies,timeout=self._timeout)
         status = r.status_code
         response = r.text
         jobj = json.loads(response)
         if status == 200:
-            return f'{jobj["token_type"]} {jobj["access_token"]}'
+            return f'{jobj["token_type"]} {jobj["access_token"]}', float(jobj.get('expires_in', 3600))
         else:
             raise Exception(f'Error - Status : {status}, Msg: {response}')
             
@@ -49,73 +1334,134 @@ class BaseAPI:
         return head
 
     def request(self, method:str, url:str, payload={}, max_tries:int=5):
+        status, ret = self._request(method, url, payload, max_tries)
+        self._last.status = status
+        return ret
+
+    def _request(self, method:str, url:str, payload={}, max_tries:int=5):
         status = 0
         tries = 0
         ret = {}
-        if self._oauth:
-            if self._token == 'bearer None':
-                self._token = self.get_oauth_token()
+        event = RequestEvent(method, url, _endpoint_template(url, self._base_uri)) if self.hooks else None
+        body, extra = None, {}
+        if method.lower().strip() in ("post", "put"):
+            body, extra = _encode_body(self._serializer, payload, self._compress, self._compress_min_bytes)
         while (not ((status == 200) or ((status == 304) and (method.lower().strip() == "put")))) and (tries < max_tries+1):
             if self._oauth:
-                head = {'Authorization':self._token}
+                token = self._tokens.get(self._fetch_oauth_token)
+                head = {'Authorization':token}
             else:
                 head = self.get_hmac_header()
             head['Content-Type'] = 'application/json'
             head['Accept'] = 'application/json'
-            if method.lower().strip() == "get":
-                r = requests.get(url=url,headers=head,proxies=self._proxies)
-            elif method.lower().strip() == "delete":
-                r = requests.delete(url=url,headers=head,proxies=self._proxies)
-            elif method.lower().strip() == "post": 
-                if type(payload) is list or type(payload) is dict:
-                    r = requests.post(url=url,headers=head,json=payload,proxies=self._proxies)
-                else:
-                    r = requests.post(url=url,headers=head,data=payload,proxies=self._proxies)
-            elif method.lower().strip() == "put": 
-                if type(payload) is list or type(payload) is dict:
-                    r = requests.put(url=url,headers=head,json=payload,proxies=self._proxies)
-                else:
-                    r = requests.put(url=url,headers=head,data=payload,proxies=self._proxies)
-            else:
+            head.update(extra)
+            verb = method.lower().strip()
+            if verb not in ("get", "delete", "post", "put"):
                 print(f'Error - method {method} not recognized')
-                return {}
+                return 0, {}
+            kwargs = {}
+            if body is not None:
+                kwargs['data'] = body
             tries = tries + 1
+            if self._rate_limiter is not None:
+                self._rate_limiter.acquire()
+            if event is not None:
+                event.tries = tries
+                event.bytes_out += 0 if body is None else len(body)
+                sent = time.perf_counter()
+            try:
+                # with hooks the body is streamed so that header and body arrival can be timed apart
+                r = self._session.request(verb,url=url,headers=head,proxies=self._proxies,timeout=self._timeout,stream=event is not None,**kwargs)
+                if event is not None:
+                    received = time.perf_counter()
+                    event.server += received - sent
+                    response = r.content
+                    event.download += time.perf_counter() - received
+                    event.bytes_in += r.raw.tell() if hasattr(r.raw, 'tell') else len(response)
+            except requests.exceptions.RequestException as ex:
+                print(f'Error - {type(ex).__name__} : {ex}')
+                print(f'   URL: {url}')
+                # a read timeout is reported as 408 so that callers can tell it from a lost connection
+                status = 408 if isinstance(ex, requests.exceptions.ReadTimeout) else 0
+                if event is not None:
+                    event.errors += 1
+                if tries < max_tries+1:
+                    time.sleep(_backoff_delay(tries, self._backoff, self._max_backoff))
+                continue
             status = r.status_code
-            response = r.text
+            response = r.content
+            if self._debug:
+                print(f'{status} : {url}')
             if status == 429:
-                print("Too many requests, wait 10 seconds and try again...")
-                time.sleep(10)
+                if event is not None:
+                    event.throttled += 1
+                delay = _retry_after(r.headers, _backoff_delay(tries, self._backoff, self._max_backoff))
+                print(f"Too many requests, wait {delay:.1f} seconds and try again...")
+                if self._rate_limiter is not None:
+                    self._rate_limiter.penalize(delay)
+                else:
+                    time.sleep(delay)
             elif self._oauth and (status == 401):
-                print(self._token,status,response)
+                if event is not None:
+                    event.unauthorized += 1
+                print(token,status,r.text)
                 print("Get a new oauth token")
-                self._token = self.get_oauth_token()
+                self._tokens.invalidate(token)
+            elif (status == 415) and ('Content-Encoding' in extra):
+                print("Server does not accept compressed requests, sending uncompressed")
+                self._compress = False
+                body, extra = _encode_body(self._serializer, payload, False, 0)
             elif (status == 200) or ((status == 304) and (method.lower().strip() == "put")):
+                parsing = time.perf_counter() if event is not None else 0.0
                 if len(response)>0:
-                    ret = json.loads(response)
+                    ret = self._serializer.loads(response)
                 else:
-                    ret = response
+                    ret = ''
+                if event is not None:
+                    event.parse += time.perf_counter() - parsing
             else:
-                print(f'Error - Status : {status}, Msg : {response}')
+                print(f'Error - Status : {status}, Msg : {r.text}')
                 print(f'   URL: {url}')
-            if self._debug:
-                print(f'{status} : {url}')
-        return ret
+                if not _is_retryable(status):
+                    break
+                if tries < max_tries+1:
+                    time.sleep(_backoff_delay(tries, self._backoff, self._max_backoff))
+        if event is not None:
+            event._emit(self.hooks, status)
+        return status, ret
 
 class ScenarioStudioAPI(BaseAPI):
-    def __init__(self,acc_key:str,enc_key:str,oauth:bool = True,proxies={},debug:bool=False):
-        super().__init__(acc_key,enc_key,oauth,proxies,debug)
-        self._base_uri = 'https://api.economy.com/scenario-studio/v2'
-        self.user_universe = {}
+    def __init__(self,acc_key:str,enc_key:str,oauth:bool = True,proxies={},debug:bool=False,base_uri:str='https://api.economy.com/scenario-studio/v2',metadata_cache:MetadataCache=None,**kwargs):
+        super().__init__(acc_key,enc_key,oauth,proxies,debug,**kwargs)
+        self._base_uri = base_uri
+        self.user_directory = UserDirectory()
+        self.metadata_cache = metadata_cache
+
+    @property
+    def user_universe(self):
+        return self.user_directory.users
+
+    @user_universe.setter
+    def user_universe(self, users):
+        # assigning a user list (as older code did) loads it; an empty value forces a reload on next use
+        if users:
+            self.user_directory.load(users)
+        else:
+            self.user_directory = UserDirectory(self.user_directory.ttl)
+
+    def _request(self, method:str, url:str, payload={}, max_tries:int=5):
+        ret = super()._request(method, url, payload, max_tries)
+        if self.metadata_cache is not None:
+            self.metadata_cache.invalidate_url(method, url)
+        return ret
+
+    def _get_metadata(self, url:str):
+        if self.metadata_cache is None:
+            return self.request(url=url,method="get")
+        return self.metadata_cache.get(url, lambda: self._request(method="get", url=url))
 
     def get_pandas_freq(self, freq:int):
-        pandas_freq = 'Q-DEC'
-        if freq == 172:
-            pandas_freq = 'Q-DEC'
-        if freq == 204:
-            pandas_freq = 'A-DEC'
-        elif freq == 128:
-            pandas_freq = 'M'
-        return pandas_freq
+        return _pandas_freq(freq)
     
     def health(self):
         url = f'{self._base_uri}/health'
@@ -159,25 +1505,59 @@ class ScenarioStudioAPI(BaseAPI):
             for skip in range(0,total,take):
                 ret.extend(self.request(url=f'{url}&skip={skip}',method="get"))
         return ret
+
+    def _iter_pages(self, fetch, total:int, page_size:int, fields:list=None):
+        # fetch(skip, take) returns one page; the next page downloads while the caller
+        # works through the current one, so at most two pages are held at a time
+        convert = _compact_record(fields)
+        skips = list(range(0, total, page_size))
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        try:
+            future = pool.submit(fetch, skips[0], page_size) if len(skips) > 0 else None
+            for i in range(len(skips)):
+                page = future.result()
+                future = pool.submit(fetch, skips[i+1], page_size) if i+1 < len(skips) else None
+                if type(page) is not list:
+                    print(f'Error - page at skip={skips[i]} could not be read')
+                    break
+                for x in page:
+                    yield convert(x)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def iter_search_projects(self,tags:list=None,terms:list=None,roles:list=None,sort='-created',page_size:int=50,fields:list=None):
+        total = self.project_count(tags=tags,terms=terms,roles=roles)
+        url = f'{self._base_uri}/project/search?options.sortBy={sort}'
+        if tags is not None:
+            for tag in tags:
+                url = f'{url}&options.tags={tag}'
+        if terms is not None:
+            for term in terms:
+                url = f'{url}&options.terms={term}'
+        if roles is not None:
+            for role in roles:
+                url = f'{url}&options.roles={role}'
+        fetch = lambda skip, take: self.request(url=f'{url}&take={take}&skip={skip}',method="get")
+        return self._iter_pages(fetch, total, page_size, fields)
     
     def get_project_info(self, project_id:str):
         url = f'{self._base_uri}/project/{project_id}'
-        ret = self.request(url=url,method="get")
+        ret = self._get_metadata(url)
         return ret
 
     def get_scenario_info(self, project_id:str, scenario_id:str):
         url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}'
-        ret = self.request(url=url,method="get")
+        ret = self._get_metadata(url)
         return ret
 
     def get_project_scenarios(self, project_id:str):
         url = f'{self._base_uri}/project/{project_id}/scenario'
-        ret = self.request(url=url,method="get")
+        ret = self._get_metadata(url)
         return ret
 
     def get_project_series(self, project_id:str):
         url = f'{self._base_uri}/project/{project_id}/series'
-        ret = self.request(url=url,method="get")
+        ret = self._get_metadata(url)
         return ret
 
     def make_project(self, title:str, tags:list=[], description:str=""):
@@ -186,10 +1566,12 @@ class ScenarioStudioAPI(BaseAPI):
         ret = self.request(url=url,method="post",payload=pl)
         return ret
 
-    def build_project(self, project_id:str, wait:bool=True, sleep:int=5):
+    def build_project(self, project_id:str, wait:bool=True, sleep:int=5, tracker:OrderTracker=None):
         url = f'{self._base_uri}/project/{project_id}/build'
         orders = self.request(url=url,method="post")
-        if wait:
+        if tracker is not None:
+            tracker.track(project_id, orders, build=True)
+        elif wait:
             self.wait_for_orders(project_id, orders, build=True, sleep=sleep)
         return orders
 
@@ -219,7 +1601,7 @@ class ScenarioStudioAPI(BaseAPI):
         ret = self.request(url=url,method="post",payload=pl)
         return ret
 
-    def local_solve(self, project_id:str, scenario_id, partial:str=None):
+    def local_solve(self, project_id:str, scenario_id, partial:str=None, tracker:OrderTracker=None):
         if type(scenario_id) is str:
             ids = [scenario_id]
         else:
@@ -232,9 +1614,11 @@ class ScenarioStudioAPI(BaseAPI):
                 ret.append(self.request(url=url,method="post",payload=pl))
             else:
                 ret.append(self.request(url=url,method="post"))
+        if tracker is not None:
+            tracker.track(project_id, ret)
         return ret
 
-    def central_solve(self, project_id:str, scenario_id):
+    def central_solve(self, project_id:str, scenario_id, tracker:OrderTracker=None):
         if type(scenario_id) is str:
             ids = [scenario_id]
         else:
@@ -243,17 +1627,21 @@ class ScenarioStudioAPI(BaseAPI):
         for id in ids:
             url = f'{self._base_uri}/project/{project_id}/scenario/{id}/solve/central'
             ret.append(self.request(url=url,method="post"))
+        if tracker is not None:
+            tracker.track(project_id, ret)
         return ret
     
-    def add_factor_solve(self, project_id:str, scenario_id:str, variables:list):
+    def add_factor_solve(self, project_id:str, scenario_id:str, variables:list, tracker:OrderTracker=None):
         url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/reendogenize'
         pl = variables
         ret = [self.request(url=url,method="post",payload=pl)]
+        if tracker is not None:
+            tracker.track(project_id, ret)
         return ret
 
     def get_base_scenario_info(self, scenario_id:str):
         url = f'{self._base_uri}/base-scenario/{scenario_id}'
-        ret = self.request(url=url,method="get")
+        ret = self._get_metadata(url)
         return ret
 
     def clone_scenario(self, project_id: str, scenario_id: str, alias:str, title:str=None, description:str=None, edit_start:int=None, forecast_end:int=None):
@@ -290,7 +1678,44 @@ class ScenarioStudioAPI(BaseAPI):
         ret = self.request(url=url,method="get")
         return ret
 
-    def get_series_data(self, project_id:str, series_list:list, freq:int=172, transformation:int=None, batch:int=100, start:int=None, end:int=None, dates=None):
+    def _fetch_series_batch(self, url:str, pl:list, retries:int=0, failed:dict=None, sizer:BatchSizer=None):
+        # Each batch has 5 * (retries+1) tries at every size (see _batch_action). A batch that
+        # fails on a timeout, 413 or 5xx is split in half and each half fetched on its own, down
+        # to single series; whatever cannot be fetched is recorded in `failed`.
+        budget = 5 * (retries + 1)
+        tries = 0
+        while True:
+            start = time.perf_counter()
+            status, series_objs = self._request(url=url,method="post",payload=pl,max_tries=0)
+            tries += 1
+            if type(series_objs) is list:
+                if sizer is not None:
+                    sizer.observe(len(pl), time.perf_counter() - start, sum(x['data']['periods'] for x in series_objs if x.get('data')))
+                return series_objs
+            action = _batch_action(status, len(pl), self._oauth)
+            if action != 'retry' or tries >= budget:
+                break
+            # a 429 has already waited out its Retry-After inside _request
+            if status != 429:
+                time.sleep(_backoff_delay(tries, self._backoff, self._max_backoff))
+        if sizer is not None:
+            sizer.shrink(len(pl))
+        if action == 'split':
+            mid = len(pl) // 2
+            return self._fetch_series_batch(url, pl[:mid], retries, failed) + self._fetch_series_batch(url, pl[mid:], retries, failed)
+        print(f'Error - batch of {len(pl)} series starting {pl[0]} failed with HTTP {status} after {tries} tries')
+        if failed is not None:
+            for x in pl:
+                failed[x] = f'HTTP {status}'
+        return []
+
+    def _get_series_objs(self, project_id:str, series_list:list, freq:int=172, transformation:int=None, batch:int=100, start:int=None, end:int=None, workers:int=1, retries:int=0, adaptive:bool=False, failed:dict=None):
+        # without a `failed` dict to report into, series lost to HTTP errors raise a warning
+        if failed is None:
+            lost = {}
+            ret = self._get_series_objs(project_id, series_list, freq, transformation, batch, start, end, workers, retries, adaptive, lost)
+            _warn_failed(lost, len(series_list))
+            return ret
         url = f'{self._base_uri}/project/{project_id}/data-series?frequency={freq}'
         if transformation is not None:
             url = f'{url}&transformation={transformation}'
@@ -298,41 +1723,105 @@ class ScenarioStudioAPI(BaseAPI):
             url = f'{url}&start={start}'
         if end is not None:
             url = f'{url}&end={end}'
-        ret = {}
-        for i in range(0,len(series_list),batch):
-            pl = series_list[i:i+batch]
-            series_objs = self.request(url=url,method="post",payload=pl)
-            for series_obj in series_objs:
-                if series_obj['status'].upper().strip() == 'OK':
-                    pandas_freq = self.get_pandas_freq(series_obj['data']['freqCode'])
-                    index = pd.period_range(pd.Period(series_obj['data']['startDate'],pandas_freq),periods=series_obj['data']['periods'])
-                    series = pd.Series(series_obj['data']['data'],index)
-                    series[abs(series) > 1.7e+38] = None
-                    if dates is not None:
-                        series = series.reindex(dates)
-                    if series_obj['lastHistory'] != "N/A":
-                        series.last_hist = pd.Period(series_obj['lastHistory'],pandas_freq)
-                    series.description = series_obj['description']
-                    series.geo = series_obj['geoCode']
-                    series.observed = series_obj['observedAttribute']
-                    ret[series_obj['mnemonic']] = series
+        if adaptive:
+            # each batch is cut when it is submitted, at the size the BatchSizer has settled
+            # on so far; results are still merged in submission order
+            sizer = BatchSizer(batch)
+            results = []
+            pending = collections.deque()
+            pos = 0
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1,workers)) as pool:
+                while pos < len(series_list) or len(pending) > 0:
+                    while pos < len(series_list) and len(pending) < max(1,workers):
+                        pl = series_list[pos:pos+sizer.size]
+                        pos += len(pl)
+                        pending.append(pool.submit(self._fetch_series_batch, url, pl, retries, failed, sizer))
+                    results.append(pending.popleft().result())
+        elif workers > 1:
+            # at most `workers` batches in flight; map() yields results in batch order so the
+            # merged dict is the same as a serial download. Keep workers <= pool_maxsize.
+            batches = [series_list[i:i+batch] for i in range(0,len(series_list),batch)]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(lambda pl: self._fetch_series_batch(url,pl,retries,failed), batches))
+        else:
+            results = (self._fetch_series_batch(url,series_list[i:i+batch],retries,failed) for i in range(0,len(series_list),batch))
+        return [x for series_objs in results for x in series_objs]
+
+    def get_series_data(self, project_id:str, series_list:list, freq:int=172, transformation:int=None, batch:int=100, start:int=None, end:int=None, dates=None, workers:int=1, retries:int=0, as_frame:bool=False, adaptive:bool=False, report:bool=False):
+        # adaptive: batch is the starting size, adjusted from response times and sizes.
+        # report: also return {mnemonic: reason} for every series that could not be fetched.
+        failed = {}
+        series_objs = self._get_series_objs(project_id, series_list, freq, transformation, batch, start, end, workers, retries, adaptive, failed)
+        if as_frame:
+            ret = _frame_from_objs(series_objs, dates)
+        else:
+            ret = _series_dict(series_objs, dates)
+        if report:
+            return ret, _failed_series(series_objs, failed)
+        _warn_failed(failed, len(series_list))
         return ret
     
+    def export_series(self, project_id:str, series_list:list, path:str, freq:int=172, format:str='npy', **kwargs):
+        # downloads series_list as one frame and writes it with export_frame; kwargs go to get_series_data
+        data, info = self.get_series_data(project_id, series_list, freq=freq, as_frame=True, **kwargs)
+        export_frame(path, data, info, format)
+        return FrameStore(path)
+
+    def _scenario_variables(self, project_id:str, scenario_id:str):
+        return [x.variableId for x in self.iter_search_series(project_id, scenario_ids=[scenario_id], fields=['variableId'])]
+
+    def _scenario_alias(self, project_id:str, scenario:str):
+        # scenario id -> alias; an alias is returned as is
+        for x in self.get_project_scenarios(project_id):
+            if x['id'] == scenario:
+                return x['alias'].upper().strip()
+        return scenario.upper().strip()
+
+    def diff_scenarios(self, project_id:str, scenario_a:str, scenario_b:str, variables:list=None, freq:int=172, tolerance:float=0.0, dates=None, batch:int=100, workers:int=4):
+        # b minus a (aliases or ids) for every variable (default: all variables of a), both sides
+        # downloaded together in concurrent batches
+        alias_a, alias_b = self._scenario_alias(project_id, scenario_a), self._scenario_alias(project_id, scenario_b)
+        if variables is None:
+            ids = {x['alias'].upper().strip(): x['id'] for x in self.get_project_scenarios(project_id)}
+            variables = self._scenario_variables(project_id, ids[alias_a])
+        matrix = self.get_scenario_matrix(project_id, [alias_a, alias_b], variables, freq=freq, batch=batch, dates=dates, workers=workers)
+        return ScenarioDiff(matrix.scenario(alias_a), matrix.scenario(alias_b), tolerance)
+
+    def snapshot_checkpoint(self, project_id:str, scenario_id:str, path:str, note:str="", variables:list=None, freq:int=172, workers:int=4):
+        # The API cannot read a checkpoint's data back, so alongside the checkpoint the
+        # scenario's data is exported to path for diff_checkpoint to compare against.
+        checkpoint = self.create_checkpoint(project_id, scenario_id, note)
+        alias = self.get_scenario_info(project_id, scenario_id)['alias'].upper().strip()
+        if variables is None:
+            variables = self._scenario_variables(project_id, scenario_id)
+        store = self.export_series(project_id, [f'{alias}.{x.upper().strip()}' for x in variables], path, freq=freq, workers=workers)
+        return checkpoint, store
+
+    def diff_checkpoint(self, project_id:str, scenario_id:str, snapshot, tolerance:float=0.0, workers:int=4):
+        # current data minus a snapshot (a path or FrameStore from snapshot_checkpoint, or a DataFrame)
+        if type(snapshot) is str:
+            snapshot = FrameStore(snapshot)
+        if isinstance(snapshot, FrameStore):
+            snapshot = snapshot.frame()
+        snapshot = _upper_columns(snapshot).rename(columns=lambda x: x.split('.', 1)[-1])
+        current = self.get_scenario_frame(project_id, scenario_id, snapshot.columns, snapshot.index, workers)
+        return diff_frames(snapshot, current, tolerance)
+
+    def get_scenario_matrix(self, project_id:str, scenarios:list, variables:list, freq:int=172, transformation:int=None, batch:int=100, start:int=None, end:int=None, dates=None, workers:int=4, retries:int=0):
+        # every variable for every scenario alias, downloaded once each, as a ScenarioMatrix
+        scenarios, variables, expressions = _matrix_plan(scenarios, variables)
+        series_objs = self._get_series_objs(project_id, expressions, freq, transformation, batch, start, end, workers, retries)
+        return _matrix_from_objs(series_objs, scenarios, variables, expressions, dates)
+
     def get_variable_info(self, project_id:str, scenario_id:str, variable:str):
         url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/variable/{variable.upper().strip()}'
-        ret = self.request(url=url,method="get")
+        ret = self._get_metadata(url)
         return ret
 
-    def wait_for_orders(self, project_id:str, orders:list, build:bool=False, sleep:int=5):
-        ret = []
-        for o in orders:
-            status = self.order_status(project_id, o['orderId'], build)
-            orderDone = status['finished']
-            while not orderDone:
-                time.sleep(sleep)
-                status = self.order_status(project_id, o['orderId'], build)
-                orderDone = status['finished']
-            ret.append(status)
+    def wait_for_orders(self, project_id:str, orders:list, build:bool=False, sleep:int=5, timeout:float=None):
+        # all orders are polled together, starting fast and backing off to `sleep` seconds
+        with OrderTracker(self, min_interval=min(1.0, sleep), max_interval=sleep) as tracker:
+            ret = tracker.wait(tracker.track(project_id, orders, build), timeout)
         return ret
 
     def claim(self, project_id:str, scenario_id:str, variables:list, exogenize:bool=False):
@@ -381,12 +1870,55 @@ class ScenarioStudioAPI(BaseAPI):
     def write_series_data(self, project_id:str, scenario_id:str, variable:str, data, edit_history:bool=False):
         url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/data-series/{variable.upper()}/data/local'
         pl = {}
-        pl['startDate'] = (data.index[0]-pd.Period('1849-12-31',data.index.freq)).n
-        pl['data'] = [-3.4028234663852886E+38 if x is None or pd.isna(x) else x for x in data]
+        pl['startDate'] = _date_int(data.index[0])
+        pl['data'] = _encode_data(data)
         pl['historyModified'] = edit_history
         ret = self.request(url=url,method="put",payload=pl)
         return ret
 
+    def get_scenario_frame(self, project_id:str, scenario_id:str, variables:list, dates, workers:int=4):
+        # current data of `variables` in a scenario, on the PeriodIndex `dates`, columns by mnemonic
+        alias = self.get_scenario_info(project_id, scenario_id)['alias'].upper().strip()
+        variables = [str(x).upper().strip() for x in variables]
+        data, _ = self.get_series_data(project_id, [f'{alias}.{x}' for x in variables], freq=_api_freq(dates.freqstr), dates=dates, workers=workers, as_frame=True)
+        return _upper_columns(data).rename(columns=lambda x: x.split('.', 1)[-1]).reindex(columns=variables)
+
+    def write_frame(self, project_id:str, scenario_id:str, data, edit_history:bool=False, workers:int=4, trim:bool=True, baseline=None, tolerance:float=0.0, spans:bool=False):
+        # data is a DataFrame on a PeriodIndex with one column per mnemonic; columns with no data are reported with status 0.
+        # baseline (a DataFrame snapshot, or True to download the scenario's current data) skips
+        # columns that match it within tolerance; spans sends only the changed stretch of each column.
+        def write(item):
+            variable, pl, skipped = item
+            if pl is None:
+                return variable, skipped
+            url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/data-series/{variable}/data/local'
+            return variable, self._request(url=url,method="put",payload=pl)[0]
+        changed = None
+        if baseline is not None:
+            if baseline is True:
+                baseline = self.get_scenario_frame(project_id, scenario_id, data.columns, data.index, workers)
+            changed = _changed_cells(data, baseline, tolerance, trim)
+        payloads = _frame_payloads(data, edit_history, trim, changed, spans)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1,workers)) as pool:
+            results = list(pool.map(write, payloads))
+        return _write_report(results)
+
+    def apply_frame(self, project_id:str, scenario_id:str, data, baseline=True, tolerance:float=0.0, push:bool=True, note:str=None, edit_history:bool=False, workers:int=4, spans:bool=False):
+        # claims, writes and (optionally) pushes only the columns of data that differ from baseline
+        # (a DataFrame snapshot; None or True compares with the scenario's current data on the server)
+        if baseline is None or baseline is True:
+            baseline = self.get_scenario_frame(project_id, scenario_id, data.columns, data.index, workers)
+        data = _upper_columns(data)
+        changed = _changed_cells(data, baseline, tolerance)
+        variables = list(data.columns[changed.any(axis=0)])
+        if len(variables) > 0:
+            self.claim(project_id, scenario_id, variables)
+        report = self.write_frame(project_id, scenario_id, data, edit_history, workers, baseline=baseline, tolerance=tolerance, spans=spans)
+        written = list(report.index[report['written']])
+        if push and len(written) > 0:
+            self.push(project_id, scenario_id, written, note=note)
+        return report
+
     def edit_project_settings(self, project_id:str, edit_identities:bool=None, require_comments:bool=None, edit_equations:bool=None, allow_custom_variables:bool=None, databuffet_alias:str=None, edit_history:bool=None, edit_lasthist:bool=None):
         pl = self.get_project_info(project_id)
         url = f'{self._base_uri}/project/{project_id}/settings'
@@ -422,28 +1954,10 @@ class ScenarioStudioAPI(BaseAPI):
         return ret
 
     def search_series(self, project_id:str, scenario_ids:list=None, geos:list=None, state:int=None, local_state:int=None, query:str="", checked_out:int=None, variable_type:list=None, sharedown:bool=None, custom_series:bool=None, history_edits:bool=None, equation_edits:bool=None):
-        pl = {}
-        pl['query'] = query
-        pl['state'] = state
-        pl['checkedOut'] = checked_out
-        pl['variableType'] = variable_type
         if scenario_ids is None:
             scensInfo = self.get_project_scenarios(project_id)
-            pl['scenarioId'] = [x['id'] for x in scensInfo]
-        else:
-            pl['scenarioId'] = scenario_ids
-        if geos is not None:
-            pl['geographies'] = geos
-        if sharedown is not None:
-            pl['sharedown'] = sharedown
-        if custom_series is not None:
-            pl['customSeries'] = custom_series
-        if history_edits is not None:
-            pl['historyEdits'] = history_edits
-        if equation_edits is not None:
-            pl['equationEdits'] = equation_edits
-        if local_state is not None:
-            pl['localState'] = local_state
+            scenario_ids = [x['id'] for x in scensInfo]
+        pl = _search_series_payload(scenario_ids, geos, state, local_state, query, checked_out, variable_type, sharedown, custom_series, history_edits, equation_edits)
         url = f'{self._base_uri}/project/{project_id}/search/count'
         count = self.request(url=url,method="post",payload=pl)
         if count > 0:
@@ -453,48 +1967,139 @@ class ScenarioStudioAPI(BaseAPI):
             ret = []
         return ret
 
+    def iter_search_series(self, project_id:str, scenario_ids:list=None, geos:list=None, state:int=None, local_state:int=None, query:str="", checked_out:int=None, variable_type:list=None, sharedown:bool=None, custom_series:bool=None, history_edits:bool=None, equation_edits:bool=None, page_size:int=1000, fields:list=None):
+        # search_series one page at a time; with fields, yields namedtuples of just those keys
+        if scenario_ids is None:
+            scensInfo = self.get_project_scenarios(project_id)
+            scenario_ids = [x['id'] for x in scensInfo]
+        pl = _search_series_payload(scenario_ids, geos, state, local_state, query, checked_out, variable_type, sharedown, custom_series, history_edits, equation_edits)
+        url = f'{self._base_uri}/project/{project_id}/search/count'
+        count = self.request(url=url,method="post",payload=pl)
+        url = f'{self._base_uri}/project/{project_id}/search/results'
+        fetch = lambda skip, take: self.request(url=f'{url}?skip={skip}&take={take}',method="post",payload=pl)
+        return self._iter_pages(fetch, count if type(count) is int else 0, page_size, fields)
+
     def get_sharedown_info(self, project_id:str, scenario_id:str, variable:str):
         url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/{variable}/sharedown'
-        ret = self.request(url=url,method="get")
+        ret = self._get_metadata(url)
         return ret
 
-    def sharedown_solve(self, project_id:str, scenario_id:str, variable:str):
+    def sharedown_solve(self, project_id:str, scenario_id:str, variable:str, tracker:OrderTracker=None):
         url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/{variable}/sharedown'
         ret = [self.request(url=url,method="post")]
+        if tracker is not None:
+            tracker.track(project_id, ret)
         return ret
 
     def get_audits(self, project_id:str, scenario_ids:list=[],actions:list=[]):
         url = f'{self._base_uri}/audit/project/{project_id}'
-        params = []
-        for scenario_id in scenario_ids:
-            params.append(f'options.scenarios={scenario_id}')
-        for action in actions:
-            params.append(f'options.actions={action}')
+        params = _audit_params(scenario_ids, actions)
+        if len(params) > 0:
+            url = f'{url}?{"&".join(params)}'
+        ret = self.request(url=url,method="get")
+        return ret
+
+    def audit_count(self, project_id:str, scenario_ids:list=[],actions:list=[]):
+        url = f'{self._base_uri}/audit/project/{project_id}/count'
+        params = _audit_params(scenario_ids, actions)
         if len(params) > 0:
             url = f'{url}?{"&".join(params)}'
         ret = self.request(url=url,method="get")
         return ret
 
+    def tail_audits(self, project_id:str, cursor:AuditCursor=None, scenario_ids:list=[], actions:list=[], page_size:int=500, from_start:bool=True, follow:float=None):
+        # Yields the audit records added since the cursor last stopped, oldest first, one page in
+        # memory at a time; the cursor moves past each record as it is handed out and is saved
+        # when the generator finishes or is closed. With from_start=False a new cursor starts at
+        # the current end of the log. With follow, polls again every `follow` seconds for good.
+        # Raises when the log cannot be read, so a failure is never mistaken for "no new events".
+        tail = _AuditTail(AuditCursor() if cursor is None else cursor, project_id, scenario_ids, actions, from_start)
+        url = f'{self._base_uri}/audit/project/{project_id}?{"".join(x + "&" for x in _audit_params(scenario_ids, actions))}'
+        fetch = lambda skip, take: self.request(url=f'{url}skip={skip}&take={take}',method="get")
+        try:
+            while True:
+                total = self.audit_count(project_id, scenario_ids, actions)
+                if type(total) is not int:
+                    raise Exception(f'could not count audits for project {project_id}: {total}')
+                new = tail.start(total)
+                if new > 0 and tail.newest_first is None and total > 1:
+                    tail.order(fetch(0, 1), fetch(total - 1, 1))
+                if new > 0 and tail.newest_first:
+                    # new records are at the top of the log; hold just those and hand them out oldest first
+                    records = []
+                    skip = 0
+                    while True:
+                        page = fetch(skip, page_size)
+                        if type(page) is not list:
+                            raise Exception(f'audit page at skip={skip} of project {project_id} could not be read: {page}')
+                        if tail.collect(records, page, new) or len(page) < page_size:
+                            break
+                        skip += page_size
+                    while len(records) > 0:
+                        x = records.pop()
+                        tail.advance(x)
+                        yield x
+                elif new > 0:
+                    for skip in range(tail.position, total, page_size):
+                        page = fetch(skip, page_size)
+                        if type(page) is not list:
+                            raise Exception(f'audit page at skip={skip} of project {project_id} could not be read: {page}')
+                        for x in page:
+                            if tail.advance(x):
+                                yield x
+                        if len(page) < page_size:
+                            break
+                tail.save()
+                if follow is None:
+                    return
+                time.sleep(follow)
+        finally:
+            tail.save()
+
     def get_pushed_series(self, project_id:str, scenario_id:str):
         url = f'{self._base_uri}/audit/project/{project_id}?options.actions=4&options.scenarios={scenario_id}'
         ret = self.request(url=url,method="get")
         return ret
 
     def set_user_permission(self, project_id:str, emails:list, role:int):
-        if len(self.user_universe) == 0:
-            self.user_universe = self.get_user_universe()
+        if self.user_directory.expired():
+            self.user_directory.load(self.get_user_universe())
         url = f'{self._base_uri}/project/{project_id}/contributor/{role}'
-        pl = []
-        for email in emails:
-            sids = [x for x in self.user_universe if email.lower() == x['email'].lower()]
-            if len(sids) > 0:
-                pl.append({'sid':sids[0]['sid'], 'firstName':sids[0]['firstName'], 'lastName':sids[0]['lastName'], 'email':sids[0]['email'], 'role':role})
+        pl, unresolved = self.user_directory.contributors(emails, role)
+        if len(unresolved) > 0:
+            print(f'Users not found: {", ".join(unresolved)}')
         ret = self.request(url=url,method="put",payload=pl)
         return ret
 
+    def set_permissions(self, assignments, workers:int=8):
+        # assignments: iterable of (project_id, email or sid, role) rows, or a DataFrame with
+        # project_id, user and role columns. Sends one PUT per project and role, concurrently.
+        # Returns (report indexed by project_id and role, list of users that could not be found).
+        if isinstance(assignments, pd.DataFrame):
+            assignments = assignments[['project_id','user','role']].itertuples(index=False)
+        if self.user_directory.expired():
+            self.user_directory.load(self.get_user_universe())
+        groups = {}
+        for project_id, user, role in assignments:
+            groups.setdefault((project_id, int(role)), []).append(user)
+        unresolved = []
+        def assign(item):
+            (project_id, role), users = item
+            pl, missing = self.user_directory.contributors(users, role)
+            unresolved.extend(missing)
+            if len(pl) == 0:
+                return project_id, role, 0, 0
+            url = f'{self._base_uri}/project/{project_id}/contributor/{role}'
+            return project_id, role, len(pl), self._request(url=url,method="put",payload=pl)[0]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1,workers)) as pool:
+            results = list(pool.map(assign, groups.items()))
+        report = pd.DataFrame(results, columns=['project_id','role','users','status']).set_index(['project_id','role'])
+        report['ok'] = (report['status'] == 200) | (report['status'] == 304)
+        return report, sorted(set(unresolved))
+
     def get_user_universe(self):
         url = f'{self._base_uri}/group/client'
-        ret = self.request(url=url,method="get")
+        ret = self._get_metadata(url)
         return ret
 
     def edit_equation(self,project_id:str, scenario_id:str, variable:str, equation:str):
@@ -523,7 +2128,7 @@ class ScenarioStudioAPI(BaseAPI):
         else:
             pl['lastHistorical'] = self.date_int(last_hist)
         pl['equation'] = equation.upper()
-        pl['data'] = [-3.4028234663852886E+38 if x is None or pd.isna(x) else x for x in data]
+        pl['data'] = _encode_data(data)
         pl['addFactorType'] = add_factor_type
         pl['variableType'] = variable_type
         ret = self.request(url=url,method="post",payload=[pl])
@@ -534,10 +2139,12 @@ class ScenarioStudioAPI(BaseAPI):
         ret = self.request(url=url,method="put")
         return ret
     
-    def import_from_scenario(self, project_id:str, scenario_id_to:str, scenario_id_from:str, claim:bool=True):
+    def import_from_scenario(self, project_id:str, scenario_id_to:str, scenario_id_from:str, claim:bool=True, tracker:OrderTracker=None):
         url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id_to}/transfer-series/order'
         pl = {'sourceScenarioId':scenario_id_from, 'claim':claim}
         ret = [self.request(url=url,method="post",payload=pl)]
+        if tracker is not None:
+            tracker.track(project_id, ret)
         return ret
     
     def remove_scenario(self, project_id:str, scenario_alias:str):
@@ -552,7 +2159,7 @@ class ScenarioStudioAPI(BaseAPI):
 
     def get_scenario_checkpoints(self, project_id:str, scenario_id:str):
         url = f'{self._base_uri}/project/{project_id}/checkpoint/{scenario_id}'
-        ret = self.request(url=url,method="get")
+        ret = self._get_metadata(url)
         return ret
     
     def create_checkpoint(self, project_id:str, scenario_id:str, note:str=""):
@@ -578,9 +2185,1347 @@ class ScenarioStudioAPI(BaseAPI):
             print('No variables to reendogenize')
 
     def date_int(self,d):
-        if type(d) is pd.Period:
-            return (d - pd.Period('1849-12-31',d.freq)).n
-        elif type(d) is int:
-            return d
+        return _date_int(d)
+
+    def dates_int(self, dates):
+        return _dates_int(dates)
+
+    def int_dates(self, values, freq:int=172):
+        return _int_dates(values, freq)
+
+def _require_ok(api, ret, what:str):
+    # raises unless the request just made on this thread succeeded, so a failed step is not journaled
+    status = api.last_status()
+    if status not in (200, 304):
+        raise Exception(f'{what} failed with HTTP {status}: {ret}')
+
+class ScenarioPipeline:
+    # Runs clone -> claim -> exogenize -> write -> solve -> wait -> download -> push for many
+    # scenarios. Each scenario is a dict; only the steps it has keys for are run:
+    #   name        key used in the journal and results (defaults to the alias)
+    #   scenario_id an existing scenario to work on, or
+    #   clone       keyword arguments for ScenarioStudioAPI.clone_scenario
+    #   alias       scenario alias for downloads, when not cloning
+    #   claim, exogenize, download, push   lists of variables (push=True pushes claim + write columns)
+    #   write       DataFrame for ScenarioStudioAPI.write_frame; edit_history applies to it
+    #   solve       True for a local solve, or a partial solve string
+    #   output      path to pickle the downloaded (data, info) to, so a resumed run can skip it
+    #   note        push note
+    # Scenarios run in parallel on `workers` threads and share one OrderTracker. With a
+    # journal file, completed steps are recorded and a rerun resumes after the last of them.
+    STEPS = ('clone', 'claim', 'exogenize', 'write', 'solve', 'wait', 'download', 'push')
+
+    def __init__(self, api, project_id:str, journal:str=None, workers:int=4, sleep:int=5):
+        self._api = api
+        self._project_id = project_id
+        self._journal_file = journal
+        self._workers = workers
+        self._sleep = sleep
+        self._specs = []
+        self._lock = threading.Lock()
+        self._journal = {}
+        if journal is not None and os.path.exists(journal):
+            with open(journal) as f:
+                self._journal = json.load(f)
+
+    def add(self, spec:dict):
+        name = spec.get('name', spec.get('alias', spec.get('clone', {}).get('alias')))
+        if name is None:
+            raise Exception('ScenarioPipeline scenarios need a name, alias or clone alias')
+        self._specs.append(dict(spec, name=name))
+        return self
+
+    def _save(self):
+        if self._journal_file is None:
+            return
+        tmp = f'{self._journal_file}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._journal, f, indent=1)
+        os.replace(tmp, self._journal_file)
+
+    def _record(self, name:str, step:str, seconds:float, done:bool=True, **state):
+        with self._lock:
+            entry = self._journal.setdefault(name, {'done': [], 'timings': {}})
+            entry.update(state)
+            if done and step not in entry['done']:
+                entry['done'].append(step)
+            entry['timings'][step] = seconds
+            self._save()
+
+    def _run_step(self, step:str, spec:dict, entry:dict, tracker:OrderTracker):
+        api = self._api
+        project_id = self._project_id
+        scenario_id = entry.get('scenario_id')
+        if step == 'clone':
+            ret = api.clone_scenario(project_id, **spec['clone'])
+            if type(ret) is not dict or 'id' not in ret:
+                raise Exception(f'clone_scenario failed: {ret}')
+            return {'scenario_id': ret['id'], 'alias': spec['clone']['alias']}
+        if step == 'claim':
+            _require_ok(api, api.claim(project_id, scenario_id, spec['claim']), 'claim')
+        elif step == 'exogenize':
+            _require_ok(api, api.exogenize(project_id, scenario_id, spec['exogenize']), 'exogenize')
+        elif step == 'write':
+            report = api.write_frame(project_id, scenario_id, spec['write'], edit_history=spec.get('edit_history', False))
+            if not report['ok'].all():
+                raise Exception(f'write failed for {list(report.index[~report["ok"]])}')
+        elif step == 'solve':
+            partial = spec['solve'] if type(spec['solve']) is str else None
+            orders = api.local_solve(project_id, scenario_id, partial)
+            if not all(type(x) is dict and 'orderId' in x for x in orders):
+                raise Exception(f'local_solve failed: {orders}')
+            return {'orders': orders}
+        elif step == 'wait':
+            statuses = tracker.wait(tracker.track(project_id, entry.get('orders', [])))
+            failed = [x for x in statuses if str(x.get('message', '')).lower().strip() != 'success']
+            if len(failed) > 0:
+                raise Exception(f'solve failed: {failed}')
+        elif step == 'download':
+            alias = entry.get('alias', spec.get('alias'))
+            ret = api.get_series_data(project_id, [f'{alias}.{x}' for x in spec['download']], as_frame=True)
+            if spec.get('output') is not None:
+                pd.to_pickle(ret, spec['output'])
+            return {'_data': ret}
+        elif step == 'push':
+            variables = spec['push']
+            if variables is True:
+                variables = list(spec.get('claim', [])) + [str(x).upper() for x in spec.get('write', pd.DataFrame()).columns]
+                variables = list(dict.fromkeys(x.upper().strip() for x in variables))
+            _require_ok(api, api.push(project_id, scenario_id, variables, note=spec.get('note')), 'push')
+        return {}
+
+    def _run_scenario(self, spec:dict, tracker:OrderTracker):
+        name = spec['name']
+        with self._lock:
+            entry = dict(self._journal.get(name, {'done': [], 'timings': {}}))
+        if 'scenario_id' not in entry and spec.get('scenario_id') is not None:
+            entry['scenario_id'] = spec['scenario_id']
+        result = {'scenario_id': entry.get('scenario_id'), 'data': None, 'error': None}
+        for step in self.STEPS:
+            wanted = step in spec or (step == 'wait' and 'solve' in spec)
+            if not wanted or step in entry['done']:
+                if step == 'download' and wanted and spec.get('output') is not None:
+                    result['data'] = pd.read_pickle(spec['output'])
+                continue
+            start = time.perf_counter()
+            try:
+                state = self._run_step(step, spec, entry, tracker)
+            except Exception as ex:
+                print(f'Error - pipeline {name} failed at {step} : {ex}')
+                result['error'] = f'{step}: {ex}'
+                break
+            seconds = time.perf_counter() - start
+            result['data'] = state.pop('_data', result['data'])
+            entry.update(state)
+            entry['done'] = entry['done'] + [step]
+            # downloads without an output file are not marked done, so a resumed run fetches them again
+            self._record(name, step, seconds, done=(step != 'download' or spec.get('output') is not None), **state)
+            result['scenario_id'] = entry.get('scenario_id')
+        return name, result
+
+    def run(self):
+        # returns {name: {'scenario_id', 'data', 'error'}}; data is the (data, info) download
+        with OrderTracker(self._api, min_interval=min(1.0, self._sleep), max_interval=self._sleep) as tracker:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self._workers)) as pool:
+                results = list(pool.map(lambda spec: self._run_scenario(spec, tracker), self._specs))
+        return dict(results)
+
+    def timings(self):
+        # seconds spent in each step (columns) per scenario (rows), from this and earlier runs
+        return pd.DataFrame({name: entry.get('timings', {}) for name, entry in self._journal.items()}).T.reindex(columns=list(self.STEPS))
+
+def _expr_scenario(expr:str):
+    # scenario alias of a plain ALIAS.MNEMONIC expression (mnemonics may hold $, as in FGDP$_US);
+    # '' for formulas and unprefixed names, which any change in the project can affect
+    alias, dot, variable = expr.partition('.')
+    if dot and re.fullmatch(r'\w+', alias) and re.search(r'[\s.+\-*/^(),]', variable) is None:
+        return alias
+    return ''
+
+class _CacheAuditCursor(AuditCursor):
+    # AuditCursor kept in the SeriesCache database, next to the sync rows
+    def __init__(self, cache):
+        super().__init__()
+        self._cache = cache
+        with cache._lock:
+            self._state = {k: json.loads(v) for k, v in cache._db.execute('SELECT key, state FROM audit_cursor')}
+
+    def reset(self, project_id:str=None):
+        with self._cache._lock:
+            if project_id is None:
+                self._state = {}
+                self._cache._db.execute('DELETE FROM audit_cursor')
+            else:
+                self._state = {k: v for k, v in self._state.items() if k.split('|')[0] != project_id}
+                self._cache._db.execute('DELETE FROM audit_cursor WHERE key LIKE ?', (f'{project_id}|%',))
+            self._cache._db.commit()
+
+    def save(self):
+        with self._cache._lock:
+            self._cache._db.executemany('INSERT OR REPLACE INTO audit_cursor VALUES (?, ?)', [(k, json.dumps(v)) for k, v in self._state.items()])
+            self._cache._db.commit()
+
+class SeriesCache:
+    # On-disk (sqlite) cache of data-series responses keyed by project, series expression,
+    # frequency, transformation and date range. sync() reads the audit events added since the
+    # previous sync (its cursor is kept in the database) and drops only the entries whose
+    # scenario/variable changed; events that do not name variables drop the whole scenario, and
+    # a log that cannot be read drops the whole project. The least recently used entries are evicted
+    # once the stored responses exceed max_bytes. `actions` restricts which audit actions
+    # count as changes (default: all).
+    def __init__(self, path:str, max_bytes:int=1 << 30, actions:list=None):
+        self.max_bytes = max_bytes
+        self._actions = actions
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS series (project TEXT, expr TEXT, scenario TEXT, freq INTEGER, transformation INTEGER, span TEXT, obj BLOB, bytes INTEGER, accessed REAL, PRIMARY KEY (project, expr, freq, transformation, span))')
+        self._db.execute('CREATE TABLE IF NOT EXISTS sync (project TEXT PRIMARY KEY, last_event TEXT)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS audit_cursor (key TEXT PRIMARY KEY, state TEXT)')
+        self._db.commit()
+        # audit position per project, so that each sync (in this or a later process) reads only new events
+        self._cursor = _CacheAuditCursor(self)
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM series').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+    def invalidate(self, project_id:str, scenario_alias:str=None, variables:list=None):
+        # entries whose expression has no scenario prefix are dropped with any scenario
+        with self._lock:
+            if scenario_alias is None:
+                cur = self._db.execute('DELETE FROM series WHERE project = ?', (project_id,))
+            elif variables is None:
+                cur = self._db.execute('DELETE FROM series WHERE project = ? AND scenario IN (?, \'\')', (project_id, scenario_alias.upper()))
+            else:
+                cur = self._db.executemany('DELETE FROM series WHERE project = ? AND expr = ?', [(project_id, f'{scenario_alias.upper()}.{x}') for x in variables])
+                self._db.execute('DELETE FROM series WHERE project = ? AND scenario = \'\'', (project_id,))
+            self._db.commit()
+            return cur.rowcount
+
+    def sync(self, api, project_id:str, audits:list=None):
+        # audits: the events since the previous sync, instead of tailing the project audit log
+        if audits is None:
+            try:
+                audits = list(api.tail_audits(project_id, self._cursor, actions=self._actions or []))
+            except Exception as ex:
+                audits = str(ex)
+        if type(audits) is not list:
+            # changes cannot be ruled out: drop the project and start over at the next sync
+            print(f'Error - could not read audits for project {project_id}, cached series dropped: {audits}')
+            with self._lock:
+                self._db.execute('DELETE FROM sync WHERE project = ?', (project_id,))
+                self._db.commit()
+            self._cursor.reset(project_id)
+            return self.invalidate(project_id)
+        with self._lock:
+            row = self._db.execute('SELECT last_event FROM sync WHERE project = ?', (project_id,)).fetchone()
+        # every event is new (the cursor already skipped what earlier syncs saw, including events
+        # stamped with the same second); the sync row only tells the first sync apart
+        dropped = 0
+        if row is None:
+            dropped += self.invalidate(project_id)
+        elif len(audits) > 0:
+            aliases = {x['id']: x['alias'] for x in api.get_project_scenarios(project_id)}
+            for event in audits:
+                # an event naming no known scenario drops the project, one naming no variables the scenario
+                alias = aliases.get(_audit_scenario(event))
+                dropped += self.invalidate(project_id, alias, None if alias is None else _audit_variables(event))
+        times = [t for t in (_audit_time(x) for x in audits) if t is not None]
+        newest = max(times).isoformat() if len(times) > 0 else ('' if row is None else row[0])
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO sync VALUES (?, ?)', (project_id, newest))
+            self._db.commit()
+        return dropped
+
+    def _evict(self):
+        total = self._db.execute('SELECT COALESCE(SUM(bytes), 0) FROM series').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for rowid, size in self._db.execute('SELECT rowid, bytes FROM series ORDER BY accessed'):
+            if total <= self.max_bytes:
+                break
+            doomed.append((rowid,))
+            total -= size
+        self._db.executemany('DELETE FROM series WHERE rowid = ?', doomed)
+
+    def get_series_data(self, api, project_id:str, series_list:list, freq:int=172, transformation:int=None, start:int=None, end:int=None, dates=None, as_frame:bool=False, refresh:bool=True, **kwargs):
+        # same result as api.get_series_data; only uncached series are downloaded.
+        # kwargs (batch, workers, retries) are passed on to the download.
+        if refresh:
+            self.sync(api, project_id)
+        tf = -1 if transformation is None else transformation
+        span = f'{start}:{end}'
+        keys = [x.upper().strip() for x in series_list]
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                rows = self._db.execute(f'SELECT expr, obj FROM series WHERE project = ? AND freq = ? AND transformation = ? AND span = ? AND expr IN ({",".join("?" * len(chunk))})', [project_id, freq, tf, span] + chunk)
+                for expr, blob in rows:
+                    found[expr] = json.loads(zlib.decompress(blob))
+            now = time.time()
+            self._db.executemany('UPDATE series SET accessed = ? WHERE project = ? AND expr = ? AND freq = ? AND transformation = ? AND span = ?', [(now, project_id, x, freq, tf, span) for x in found])
+            self._db.commit()
+        misses = [x for x, key in zip(series_list, keys) if key not in found]
+        self.hits += len(series_list) - len(misses)
+        self.misses += len(misses)
+        if len(misses) > 0:
+            rows = []
+            now = time.time()
+            for obj in api._get_series_objs(project_id, misses, freq, transformation, start=start, end=end, **kwargs):
+                if obj['status'].upper().strip() != 'OK':
+                    continue
+                expr = obj['mnemonic'].upper().strip()
+                found[expr] = obj
+                blob = zlib.compress(json.dumps(obj).encode('utf-8'))
+                rows.append((project_id, expr, _expr_scenario(expr), freq, tf, span, blob, len(blob), now))
+            with self._lock:
+                self._db.executemany('INSERT OR REPLACE INTO series VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                self._evict()
+                self._db.commit()
+        series_objs = [found[key] for key in dict.fromkeys(keys) if key in found]
+        if as_frame:
+            return _frame_from_objs(series_objs, dates)
+        return _series_dict(series_objs, dates)
+
+_FRAME_META = 'meta.json'
+_FRAME_INFO = 'info.json'
+_FRAME_FILES = {'npy': 'data.npy', 'parquet': 'data.parquet'}
+
+def _replace_file(path:str, write):
+    # write(f) into a temporary file next to path, then move it into place
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        # exports are shared between jobs; mkstemp files are private to the owner
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def export_frame(path:str, data, info=None, format:str='npy'):
+    # Writes series sharing one frequency to the directory `path`: data is a DataFrame on a
+    # PeriodIndex with one column per series (with info, as from get_series_data(..., as_frame=True))
+    # or the dict of Series returned without as_frame. format='npy' stores one contiguous float64
+    # row per series so any subset can be read from a memory map; 'parquet' needs pyarrow.
+    # info.json holds the info table; meta.json (index, columns) is written last, so readers
+    # never see a partial export.
+    if format not in _FRAME_FILES:
+        raise Exception(f'export_frame format must be one of {list(_FRAME_FILES)}')
+    if isinstance(data, dict):
+        series = list(data.values())
+        info = pd.DataFrame({'last_hist': [getattr(x, 'last_hist', pd.NaT) for x in series],
+                             'description': [getattr(x, 'description', None) for x in series],
+                             'geo': [getattr(x, 'geo', None) for x in series],
+                             'observed': [getattr(x, 'observed', None) for x in series]},
+                            index=pd.Index(list(data.keys()), name='mnemonic'))
+        data = pd.DataFrame(data)
+    if not isinstance(data.index, pd.PeriodIndex):
+        raise Exception('export_frame requires data on a PeriodIndex')
+    os.makedirs(path, exist_ok=True)
+    columns = [str(x) for x in data.columns]
+    block = np.ascontiguousarray(data.to_numpy(dtype=np.float64, na_value=np.nan).T)
+    if format == 'npy':
+        _replace_file(os.path.join(path, _FRAME_FILES[format]), lambda f: np.save(f, block))
+    else:
+        _replace_file(os.path.join(path, _FRAME_FILES[format]), lambda f: pd.DataFrame(block.T, columns=columns).to_parquet(f, index=False))
+    ordinals = data.index.asi8
+    meta = {'version': 1, 'format': format, 'freq': data.index.freqstr, 'columns': columns}
+    if len(ordinals) > 0 and (np.diff(ordinals) == 1).all():
+        meta['start'], meta['periods'] = int(ordinals[0]), len(ordinals)
+    else:
+        meta['ordinals'] = ordinals.tolist()
+    if info is not None:
+        info = info.reindex(data.columns)
+        records = {str(k): {'last_hist': None if pd.isna(x['last_hist']) else str(x['last_hist']), 'description': x['description'],
+                            'geo': x['geo'], 'observed': x['observed']} for k, x in info.iterrows()}
+        _replace_file(os.path.join(path, _FRAME_INFO), lambda f: f.write(json.dumps(records).encode('utf-8')))
+    elif os.path.exists(os.path.join(path, _FRAME_INFO)):
+        os.unlink(os.path.join(path, _FRAME_INFO))
+    _replace_file(os.path.join(path, _FRAME_META), lambda f: f.write(json.dumps(meta).encode('utf-8')))
+    return path
+
+class FrameStore:
+    # Read side of export_frame. An npy export is memory-mapped: opening costs the same at any
+    # size, only the pages of the series read are loaded, and values() of a single series is a
+    # zero-copy (read-only) view. Parquet exports read only the requested columns. The info
+    # table is read on first use.
+    def __init__(self, path:str):
+        with open(os.path.join(path, _FRAME_META)) as f:
+            meta = json.load(f)
+        self.path = path
+        self.format = meta['format']
+        self.columns = meta['columns']
+        self._freq = meta['freq']
+        self._rows = {x: i for i, x in enumerate(self.columns)}
+        if 'ordinals' in meta:
+            self.index = pd.PeriodIndex(pd.arrays.PeriodArray(np.array(meta['ordinals'], dtype=np.int64), dtype=pd.PeriodDtype(self._freq)))
         else:
-            raise Exception('date_to_int only accepts pd.Period or int types')
\ No newline at end of file
+            self.index = _period_index(self._freq, meta['start'], meta['periods'])
+        self._info = None
+        self._block = None
+        if self.format == 'npy':
+            self._block = np.load(os.path.join(path, _FRAME_FILES['npy']), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __contains__(self, column:str):
+        return column in self._rows
+
+    def __getitem__(self, columns):
+        if type(columns) is str:
+            return self.series(columns)
+        return self.frame(columns)
+
+    def _info_records(self):
+        if self._info is None:
+            path = os.path.join(self.path, _FRAME_INFO)
+            self._info = {}
+            if os.path.exists(path):
+                with open(path) as f:
+                    self._info = json.load(f)
+        return self._info
+
+    def _row_list(self, columns:list):
+        missing = [x for x in columns if x not in self._rows]
+        if len(missing) > 0:
+            raise KeyError(f'Not in {self.path}: {", ".join(missing[:10])}')
+        return [self._rows[x] for x in columns]
+
+    def values(self, columns):
+        # one series -> 1-d view of the map; a list -> (series x periods) array read in file order
+        if type(columns) is str:
+            if self._block is not None:
+                return self._block[self._row_list([columns])[0]]
+            columns = [columns]
+            return self.values(columns)[0]
+        rows = self._row_list(columns)
+        if self._block is None:
+            return pd.read_parquet(os.path.join(self.path, _FRAME_FILES['parquet']), columns=list(columns), memory_map=True).to_numpy(dtype=np.float64).T
+        order = np.argsort(rows)
+        block = np.empty((len(rows), len(self.index)))
+        block[order] = self._block[np.asarray(rows)[order]]
+        return block
+
+    def frame(self, columns:list=None):
+        columns = self.columns if columns is None else list(columns)
+        return pd.DataFrame(self.values(columns).T, index=self.index, columns=columns, copy=False)
+
+    def series(self, column:str):
+        series = pd.Series(self.values(column), index=self.index, name=column, copy=False)
+        if column in self._info_records():
+            x = self._info[column]
+            if x['last_hist'] is not None:
+                series.last_hist = _period(x['last_hist'], self._freq)
+            series.description = x['description']
+            series.geo = x['geo']
+            series.observed = x['observed']
+        return series
+
+    def info(self, columns:list=None):
+        columns = self.columns if columns is None else list(columns)
+        info = self._info_records()
+        rows = [info.get(x, {}) for x in columns]
+        return pd.DataFrame({'last_hist': [_period(x['last_hist'], self._freq) if x.get('last_hist') is not None else pd.NaT for x in rows],
+                             'description': [x.get('description') for x in rows],
+                             'geo': [x.get('geo') for x in rows],
+                             'observed': [x.get('observed') for x in rows]},
+                            index=pd.Index(columns, name='mnemonic'))
+
+def open_frame(path:str):
+    return FrameStore(path)
+
+class AsyncBaseAPI:
+    def __init__(self,acc_key:str,enc_key:str,oauth:bool = True, proxies={}, debug:bool=False, pool_maxsize:int=100, pool_per_host:int=0, timeout=(10,300), max_concurrency:int=50, rate_limiter:RateLimiter=None, backoff:float=1.0, max_backoff:float=60.0, token_cache:str=None, token_refresh_margin:float=60.0, serializer=None, compress:bool=False, compress_min_bytes:int=16384, hooks:list=None):
+        if aiohttp is None:
+            raise ImportError('AsyncBaseAPI requires aiohttp (pip install aiohttp)')
+        self._base_uri = 'https://api.economy.com'
+        self._acc_key = acc_key
+        self._enc_key = enc_key
+        self._tokens = TokenManager(acc_key, token_refresh_margin, token_cache)
+        self._oauth = oauth
+        self._serializer = JSONSerializer() if serializer is None else serializer
+        self._compress = compress
+        self._compress_min_bytes = compress_min_bytes
+        self._proxy = proxies.get('https', proxies.get('http'))
+        self._debug = debug
+        self._pool_maxsize = pool_maxsize
+        self._pool_per_host = pool_per_host
+        if type(timeout) is tuple:
+            self._timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        else:
+            self._timeout = aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)
+        # caps requests in flight across every coroutine sharing this client
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._token_lock = asyncio.Lock()
+        self._session = None
+        self._rate_limiter = rate_limiter
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self.hooks = [] if hooks is None else list(hooks)
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def _get_session(self):
+        # aiohttp sessions must be created inside the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._pool_maxsize, limit_per_host=self._pool_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self._timeout)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def get_oauth_token(self):
+        return (await self._fetch_oauth_token())[0]
+
+    async def _fetch_oauth_token(self):
+        access_key = self._acc_key
+        private_key = self._enc_key
+        url = f'{self._base_uri}/oauth2/token'
+        head = {'Content-Type':'application/x-www-form-urlencoded'}
+        data = f'client_id={access_key}&client_secret={private_key}&grant_type=client_credentials'
+        async with self._get_session().post(url,headers=head,data=data,proxy=self._proxy) as r:
+            status = r.status
+            response = await r.text()
+        jobj = json.loads(response)
+        if status == 200:
+            return f'{jobj["token_type"]} {jobj["access_token"]}', float(jobj.get('expires_in', 3600))
+        else:
+            raise Exception(f'Error - Status : {status}, Msg: {response}')
+
+    async def _get_token(self):
+        # only the first coroutine to find the token missing or expiring fetches a new one
+        token = self._tokens.current()
+        if token is None:
+            async with self._token_lock:
+                token = self._tokens.current()
+                if token is None:
+                    token, expires_in = await self._fetch_oauth_token()
+                    self._tokens.set(token, expires_in)
+        return token
+
+    def get_hmac_header(self):
+        return BaseAPI.get_hmac_header(self)
+
+    async def request(self, method:str, url:str, payload={}, max_tries:int=5):
+        return (await self._request(method, url, payload, max_tries))[1]
+
+    async def _request(self, method:str, url:str, payload={}, max_tries:int=5):
+        status = 0
+        tries = 0
+        ret = {}
+        verb = method.lower().strip()
+        if verb not in ("get", "delete", "post", "put"):
+            print(f'Error - method {method} not recognized')
+            return 0, {}
+        event = RequestEvent(method, url, _endpoint_template(url, self._base_uri)) if self.hooks else None
+        body, extra = None, {}
+        if verb in ("post", "put"):
+            body, extra = _encode_body(self._serializer, payload, self._compress, self._compress_min_bytes)
+        while (not ((status == 200) or ((status == 304) and (verb == "put")))) and (tries < max_tries+1):
+            if self._oauth:
+                token = await self._get_token()
+                head = {'Authorization':token}
+            else:
+                head = self.get_hmac_header()
+            head['Content-Type'] = 'application/json'
+            head['Accept'] = 'application/json'
+            head.update(extra)
+            kwargs = {}
+            if body is not None:
+                kwargs['data'] = body
+            tries = tries + 1
+            if self._rate_limiter is not None:
+                await self._rate_limiter.acquire_async()
+            try:
+                async with self._semaphore:
+                    if event is not None:
+                        event.tries = tries
+                        event.bytes_out += 0 if body is None else len(body)
+                        sent = time.perf_counter()
+                    async with self._get_session().request(verb,url,headers=head,proxy=self._proxy,**kwargs) as r:
+                        if event is not None:
+                            received = time.perf_counter()
+                            event.server += received - sent
+                        status = r.status
+                        response = await r.read()
+                        headers = r.headers
+                        if event is not None:
+                            event.download += time.perf_counter() - received
+                            event.bytes_in += r.content.total_bytes
+            except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+                print(f'Error - {type(ex).__name__} : {ex}')
+                print(f'   URL: {url}')
+                # a timeout is reported as 408 so that callers can tell it from a lost connection
+                status = 408 if isinstance(ex, asyncio.TimeoutError) and not isinstance(ex, getattr(aiohttp, 'ConnectionTimeoutError', ())) else 0
+                if event is not None:
+                    event.errors += 1
+                if tries < max_tries+1:
+                    await asyncio.sleep(_backoff_delay(tries, self._backoff, self._max_backoff))
+                continue
+            if self._debug:
+                print(f'{status} : {url}')
+            if status == 429:
+                if event is not None:
+                    event.throttled += 1
+                delay = _retry_after(headers, _backoff_delay(tries, self._backoff, self._max_backoff))
+                print(f"Too many requests, wait {delay:.1f} seconds and try again...")
+                if self._rate_limiter is not None:
+                    await self._rate_limiter.penalize_async(delay)
+                else:
+                    await asyncio.sleep(delay)
+            elif self._oauth and (status == 401):
+                if event is not None:
+                    event.unauthorized += 1
+                print(token,status,response.decode('utf-8','replace'))
+                print("Get a new oauth token")
+                self._tokens.invalidate(token)
+            elif (status == 415) and ('Content-Encoding' in extra):
+                print("Server does not accept compressed requests, sending uncompressed")
+                self._compress = False
+                body, extra = _encode_body(self._serializer, payload, False, 0)
+            elif (status == 200) or ((status == 304) and (verb == "put")):
+                parsing = time.perf_counter() if event is not None else 0.0
+                if len(response)>0:
+                    ret = self._serializer.loads(response)
+                else:
+                    ret = ''
+                if event is not None:
+                    event.parse += time.perf_counter() - parsing
+            else:
+                print(f'Error - Status : {status}, Msg : {response.decode("utf-8","replace")}')
+                print(f'   URL: {url}')
+                if not _is_retryable(status):
+                    break
+                if tries < max_tries+1:
+                    await asyncio.sleep(_backoff_delay(tries, self._backoff, self._max_backoff))
+        if event is not None:
+            event._emit(self.hooks, status)
+        return status, ret
+
+class AsyncScenarioStudioAPI(AsyncBaseAPI):
+    def __init__(self,acc_key:str,enc_key:str,oauth:bool = True,proxies={},debug:bool=False,base_uri:str='https://api.economy.com/scenario-studio/v2',metadata_cache:MetadataCache=None,**kwargs):
+        super().__init__(acc_key,enc_key,oauth,proxies,debug,**kwargs)
+        self._base_uri = base_uri
+        self.user_directory = UserDirectory()
+        self.metadata_cache = metadata_cache
+
+    @property
+    def user_universe(self):
+        return self.user_directory.users
+
+    @user_universe.setter
+    def user_universe(self, users):
+        # assigning a user list (as older code did) loads it; an empty value forces a reload on next use
+        if users:
+            self.user_directory.load(users)
+        else:
+            self.user_directory = UserDirectory(self.user_directory.ttl)
+
+    async def _request(self, method:str, url:str, payload={}, max_tries:int=5):
+        ret = await super()._request(method, url, payload, max_tries)
+        if self.metadata_cache is not None:
+            self.metadata_cache.invalidate_url(method, url)
+        return ret
+
+    async def _get_metadata(self, url:str):
+        if self.metadata_cache is None:
+            return await self.request(url=url,method="get")
+        found, value = self.metadata_cache.lookup(url)
+        if found:
+            return value
+        status, value = await self._request(method="get", url=url)
+        if status == 200:
+            self.metadata_cache.store(url, value)
+        return value
+
+    def get_pandas_freq(self, freq:int):
+        return _pandas_freq(freq)
+
+    def date_int(self,d):
+        return _date_int(d)
+
+    def dates_int(self, dates):
+        return _dates_int(dates)
+
+    def int_dates(self, values, freq:int=172):
+        return _int_dates(values, freq)
+
+    async def health(self):
+        url = f'{self._base_uri}/health'
+        ret = await self.request(url=url,method="get")
+        return ret
+
+    async def get_project_list(self):
+        url = f'{self._base_uri}/project'
+        ret = await self.request(url=url,method="get")
+        return ret
+
+    def _project_search_url(self, url:str, tags:list=None, terms:list=None, roles:list=None):
+        if tags is not None:
+            for tag in tags:
+                url = f'{url}&options.tags={tag}'
+        if terms is not None:
+            for term in terms:
+                url = f'{url}&options.terms={term}'
+        if roles is not None:
+            for role in roles:
+                url = f'{url}&options.roles={role}'
+        return url
+
+    async def project_count(self,tags:list=None,terms:list=None,roles:list=None):
+        url = self._project_search_url(f'{self._base_uri}/project/search/count?options.sortBy=-created',tags,terms,roles)
+        ret = await self.request(url=url,method="get")
+        return ret
+
+    async def search_projects(self,tags:list=None,terms:list=None,roles:list=None,sort='-created'):
+        total = await self.project_count(tags=tags,terms=terms,roles=roles)
+        take = 50
+        ret = []
+        if total > 0:
+            url = self._project_search_url(f'{self._base_uri}/project/search?options.sortBy={sort}&take={take}',tags,terms,roles)
+            pages = await asyncio.gather(*[self.request(url=f'{url}&skip={skip}',method="get") for skip in range(0,total,take)])
+            for page in pages:
+                ret.extend(page)
+        return ret
+
+    async def _iter_pages(self, fetch, total:int, page_size:int, fields:list=None):
+        convert = _compact_record(fields)
+        skips = list(range(0, total, page_size))
+        task = asyncio.ensure_future(fetch(skips[0], page_size)) if len(skips) > 0 else None
+        try:
+            for i in range(len(skips)):
+                page = await task
+                task = asyncio.ensure_future(fetch(skips[i+1], page_size)) if i+1 < len(skips) else None
+                if type(page) is not list:
+                    print(f'Error - page at skip={skips[i]} could not be read')
+                    break
+                for x in page:
+                    yield convert(x)
+        finally:
+            if task is not None:
+                task.cancel()
+
+    async def iter_search_projects(self,tags:list=None,terms:list=None,roles:list=None,sort='-created',page_size:int=50,fields:list=None):
+        total = await self.project_count(tags=tags,terms=terms,roles=roles)
+        url = self._project_search_url(f'{self._base_uri}/project/search?options.sortBy={sort}',tags,terms,roles)
+        fetch = lambda skip, take: self.request(url=f'{url}&take={take}&skip={skip}',method="get")
+        async for x in self._iter_pages(fetch, total, page_size, fields):
+            yield x
+
+    async def get_project_info(self, project_id:str):
+        url = f'{self._base_uri}/project/{project_id}'
+        ret = await self._get_metadata(url)
+        return ret
+
+    async def get_scenario_info(self, project_id:str, scenario_id:str):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}'
+        ret = await self._get_metadata(url)
+        return ret
+
+    async def get_project_scenarios(self, project_id:str):
+        url = f'{self._base_uri}/project/{project_id}/scenario'
+        ret = await self._get_metadata(url)
+        return ret
+
+    async def get_project_series(self, project_id:str):
+        url = f'{self._base_uri}/project/{project_id}/series'
+        ret = await self._get_metadata(url)
+        return ret
+
+    async def make_project(self, title:str, tags:list=[], description:str=""):
+        url = f'{self._base_uri}/project/create'
+        pl = {'title': title, 'tags': tags, 'description': description}
+        ret = await self.request(url=url,method="post",payload=pl)
+        return ret
+
+    async def build_project(self, project_id:str, wait:bool=True, sleep:int=5):
+        url = f'{self._base_uri}/project/{project_id}/build'
+        orders = await self.request(url=url,method="post")
+        if wait:
+            await self.wait_for_orders(project_id, orders, build=True, sleep=sleep)
+        return orders
+
+    async def get_base_scenario_list(self, model_types:list=[], terms:list=[], vintages:list=[], sort_by:str=""):
+        url = f'{self._base_uri}/base-scenario/search'
+        pl = {}
+        if len(model_types) > 0:
+            pl['modelTypes'] = model_types
+        if len(terms) > 0:
+            pl['terms'] = terms
+        if len(vintages) > 0:
+            pl['vintages'] = vintages
+        if len(sort_by) > 0:
+            pl['sortBy'] = sort_by
+        ret = await self.request(url=url,method="post",payload=pl)
+        return ret
+
+    async def get_base_scenario_count(self, model_types:list=[], terms:list=[], vintages:list=[]):
+        url = f'{self._base_uri}/base-scenario/search/count'
+        pl = {}
+        if len(model_types) > 0:
+            pl['modelTypes'] = model_types
+        if len(terms) > 0:
+            pl['terms'] = terms
+        if len(vintages) > 0:
+            pl['vintages'] = vintages
+        ret = await self.request(url=url,method="post",payload=pl)
+        return ret
+
+    async def local_solve(self, project_id:str, scenario_id, partial:str=None):
+        if type(scenario_id) is str:
+            ids = [scenario_id]
+        else:
+            ids = scenario_id
+        calls = []
+        for id in ids:
+            url = f'{self._base_uri}/project/{project_id}/scenario/{id}/solve/local'
+            if partial is not None:
+                calls.append(self.request(url=url,method="post",payload={'partial':partial}))
+            else:
+                calls.append(self.request(url=url,method="post"))
+        ret = list(await asyncio.gather(*calls))
+        return ret
+
+    async def central_solve(self, project_id:str, scenario_id):
+        if type(scenario_id) is str:
+            ids = [scenario_id]
+        else:
+            ids = scenario_id
+        calls = [self.request(url=f'{self._base_uri}/project/{project_id}/scenario/{id}/solve/central',method="post") for id in ids]
+        ret = list(await asyncio.gather(*calls))
+        return ret
+
+    async def add_factor_solve(self, project_id:str, scenario_id:str, variables:list):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/reendogenize'
+        pl = variables
+        ret = [await self.request(url=url,method="post",payload=pl)]
+        return ret
+
+    async def get_base_scenario_info(self, scenario_id:str):
+        url = f'{self._base_uri}/base-scenario/{scenario_id}'
+        ret = await self._get_metadata(url)
+        return ret
+
+    async def clone_scenario(self, project_id: str, scenario_id: str, alias:str, title:str=None, description:str=None, edit_start:int=None, forecast_end:int=None):
+        pl = await self.get_base_scenario_info(scenario_id)
+        url = f'{self._base_uri}/project/{project_id}/scenario/clone'
+        pl['alias'] = alias
+        if title is not None:
+            pl['title'] = title
+        if description is not None:
+            pl['description'] = description
+        if edit_start is not None:
+            pl['editStart'] = edit_start
+        if forecast_end is not None:
+            pl['forecastEnd'] = forecast_end
+            pl['truncate'] = True
+        ret = await self.request(url=url,method="post",payload=pl)
+        return ret
+
+    async def add_read_only_scenario(self, project_id: str, scenario_id:str, alias:str, title:str = None):
+        url = f'{self._base_uri}/project/{project_id}/scenario/copy'
+        pl = {'alias':alias,'id':scenario_id}
+        if title is None:
+            bsi = await self.get_base_scenario_info(scenario_id)
+            pl['title'] = bsi['title']
+        else:
+            pl['title'] = title
+        ret = await self.request(url=url,method="post",payload=pl)
+        return ret
+
+    async def order_status(self, project_id:str, orderId:str, build:bool=False):
+        url = f'{self._base_uri}/project/{project_id}/order/{orderId}'
+        if build:
+            url = f'{url}/build'
+        ret = await self.request(url=url,method="get")
+        return ret
+
+    async def _fetch_series_batch(self, url:str, pl:list, retries:int=0, failed:dict=None):
+        budget = 5 * (retries + 1)
+        tries = 0
+        while True:
+            status, series_objs = await self._request(url=url,method="post",payload=pl,max_tries=0)
+            tries += 1
+            if type(series_objs) is list:
+                return series_objs
+            action = _batch_action(status, len(pl), self._oauth)
+            if action != 'retry' or tries >= budget:
+                break
+            if status != 429:
+                await asyncio.sleep(_backoff_delay(tries, self._backoff, self._max_backoff))
+        if action == 'split':
+            mid = len(pl) // 2
+            halves = await asyncio.gather(self._fetch_series_batch(url, pl[:mid], retries, failed), self._fetch_series_batch(url, pl[mid:], retries, failed))
+            return halves[0] + halves[1]
+        print(f'Error - batch of {len(pl)} series starting {pl[0]} failed with HTTP {status} after {tries} tries')
+        if failed is not None:
+            for x in pl:
+                failed[x] = f'HTTP {status}'
+        return []
+
+    async def get_series_data(self, project_id:str, series_list:list, freq:int=172, transformation:int=None, batch:int=100, start:int=None, end:int=None, dates=None, retries:int=0, as_frame:bool=False, report:bool=False):
+        url = f'{self._base_uri}/project/{project_id}/data-series?frequency={freq}'
+        if transformation is not None:
+            url = f'{url}&transformation={transformation}'
+        if start is not None:
+            url = f'{url}&start={start}'
+        if end is not None:
+            url = f'{url}&end={end}'
+        # batches run concurrently (bounded by the client semaphore) and are merged in request order
+        failed = {}
+        results = await asyncio.gather(*[self._fetch_series_batch(url,series_list[i:i+batch],retries,failed) for i in range(0,len(series_list),batch)])
+        series_objs = [x for objs in results for x in objs]
+        if as_frame:
+            ret = _frame_from_objs(series_objs, dates)
+        else:
+            ret = _series_dict(series_objs, dates)
+        if report:
+            return ret, _failed_series(series_objs, failed)
+        _warn_failed(failed, len(series_list))
+        return ret
+
+    async def export_series(self, project_id:str, series_list:list, path:str, freq:int=172, format:str='npy', **kwargs):
+        data, info = await self.get_series_data(project_id, series_list, freq=freq, as_frame=True, **kwargs)
+        export_frame(path, data, info, format)
+        return FrameStore(path)
+
+    async def _scenario_variables(self, project_id:str, scenario_id:str):
+        return [x.variableId async for x in self.iter_search_series(project_id, scenario_ids=[scenario_id], fields=['variableId'])]
+
+    async def _scenario_alias(self, project_id:str, scenario:str):
+        for x in await self.get_project_scenarios(project_id):
+            if x['id'] == scenario:
+                return x['alias'].upper().strip()
+        return scenario.upper().strip()
+
+    async def diff_scenarios(self, project_id:str, scenario_a:str, scenario_b:str, variables:list=None, freq:int=172, tolerance:float=0.0, dates=None, batch:int=100):
+        alias_a, alias_b = await self._scenario_alias(project_id, scenario_a), await self._scenario_alias(project_id, scenario_b)
+        if variables is None:
+            ids = {x['alias'].upper().strip(): x['id'] for x in await self.get_project_scenarios(project_id)}
+            variables = await self._scenario_variables(project_id, ids[alias_a])
+        matrix = await self.get_scenario_matrix(project_id, [alias_a, alias_b], variables, freq=freq, batch=batch, dates=dates)
+        return ScenarioDiff(matrix.scenario(alias_a), matrix.scenario(alias_b), tolerance)
+
+    async def snapshot_checkpoint(self, project_id:str, scenario_id:str, path:str, note:str="", variables:list=None, freq:int=172):
+        checkpoint = await self.create_checkpoint(project_id, scenario_id, note)
+        alias = (await self.get_scenario_info(project_id, scenario_id))['alias'].upper().strip()
+        if variables is None:
+            variables = await self._scenario_variables(project_id, scenario_id)
+        store = await self.export_series(project_id, [f'{alias}.{x.upper().strip()}' for x in variables], path, freq=freq)
+        return checkpoint, store
+
+    async def diff_checkpoint(self, project_id:str, scenario_id:str, snapshot, tolerance:float=0.0):
+        if type(snapshot) is str:
+            snapshot = FrameStore(snapshot)
+        if isinstance(snapshot, FrameStore):
+            snapshot = snapshot.frame()
+        snapshot = _upper_columns(snapshot).rename(columns=lambda x: x.split('.', 1)[-1])
+        current = await self.get_scenario_frame(project_id, scenario_id, snapshot.columns, snapshot.index)
+        return diff_frames(snapshot, current, tolerance)
+
+    async def get_scenario_matrix(self, project_id:str, scenarios:list, variables:list, freq:int=172, transformation:int=None, batch:int=100, start:int=None, end:int=None, dates=None, retries:int=0):
+        scenarios, variables, expressions = _matrix_plan(scenarios, variables)
+        url = f'{self._base_uri}/project/{project_id}/data-series?frequency={freq}'
+        if transformation is not None:
+            url = f'{url}&transformation={transformation}'
+        if start is not None:
+            url = f'{url}&start={start}'
+        if end is not None:
+            url = f'{url}&end={end}'
+        failed = {}
+        results = await asyncio.gather(*[self._fetch_series_batch(url,expressions[i:i+batch],retries,failed) for i in range(0,len(expressions),batch)])
+        _warn_failed(failed, len(expressions))
+        return _matrix_from_objs([x for objs in results for x in objs], scenarios, variables, expressions, dates)
+
+    async def get_variable_info(self, project_id:str, scenario_id:str, variable:str):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/variable/{variable.upper().strip()}'
+        ret = await self._get_metadata(url)
+        return ret
+
+    async def _wait_for_order(self, project_id:str, orderId:str, build:bool, sleep:int, max_failures:int=3):
+        interval = min(1.0, sleep)
+        failures = 0
+        status = await self.order_status(project_id, orderId, build)
+        while not (_order_read(status) and status.get('finished')):
+            failures = 0 if _order_read(status) else failures + 1
+            if failures >= max_failures:
+                raise Exception(f'status of order {orderId} could not be read {failures} times: {status}')
+            await asyncio.sleep(interval)
+            interval = min(sleep, interval * 1.5)
+            status = await self.order_status(project_id, orderId, build)
+        return status
+
+    async def wait_for_orders(self, project_id:str, orders:list, build:bool=False, sleep:int=5, timeout:float=None):
+        # all orders are polled together, starting fast and backing off to `sleep` seconds
+        waits = asyncio.gather(*[self._wait_for_order(project_id, o['orderId'], build, sleep) for o in _order_list(orders)])
+        ret = list(await asyncio.wait_for(waits, timeout))
+        return ret
+
+    async def claim(self, project_id:str, scenario_id:str, variables:list, exogenize:bool=False):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/checkout?exogenize={exogenize}'
+        pl = [x.upper().strip() for x in variables]
+        ret = await self.request(url=url,method="post",payload=pl)
+        return ret
+
+    async def get_claim_list(self, project_id:str):
+        url = f'{self._base_uri}/project/{project_id}/series/checked-out'
+        ret = await self.request(url=url,method="get")
+        return ret
+
+    async def release(self, project_id:str, scenario_id:str, variables:list):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/checkin'
+        pl = [x.upper().strip() for x in variables]
+        ret = await self.request(url=url,method="post",payload=pl)
+        return ret
+
+    async def push(self, project_id:str, scenario_id:str, variables:list, note:str=None):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/commit'
+        pl = {'variables': [x.upper().strip() for x in variables]}
+        if note is not None:
+            pl['note'] = note
+        ret = await self.request(url=url,method="post",payload=pl)
+        return ret
+
+    async def endogenize(self, project_id:str, scenario_id:str, variables:list):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/endogenizeBulk'
+        pl = [x.upper().strip() for x in variables]
+        ret = await self.request(url=url,method="put",payload=pl)
+        return ret
+
+    async def exogenize(self, project_id:str, scenario_id:str, variables:list):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/exogenize'
+        pl = [x.upper().strip() for x in variables]
+        ret = await self.request(url=url,method="put",payload=pl)
+        return ret
+
+    async def exogenize_through(self, project_id:str, scenario_id:str, variables:list, date:int):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/exogenize-through'
+        pl = {'variables': [x.upper().strip() for x in variables], 'exogenizeThrough': date}
+        ret = await self.request(url=url,method="put",payload=pl)
+        return ret
+
+    async def write_series_data(self, project_id:str, scenario_id:str, variable:str, data, edit_history:bool=False):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/data-series/{variable.upper()}/data/local'
+        pl = {}
+        pl['startDate'] = _date_int(data.index[0])
+        pl['data'] = _encode_data(data)
+        pl['historyModified'] = edit_history
+        ret = await self.request(url=url,method="put",payload=pl)
+        return ret
+
+    async def get_scenario_frame(self, project_id:str, scenario_id:str, variables:list, dates):
+        alias = (await self.get_scenario_info(project_id, scenario_id))['alias'].upper().strip()
+        variables = [str(x).upper().strip() for x in variables]
+        data, _ = await self.get_series_data(project_id, [f'{alias}.{x}' for x in variables], freq=_api_freq(dates.freqstr), dates=dates, as_frame=True)
+        return _upper_columns(data).rename(columns=lambda x: x.split('.', 1)[-1]).reindex(columns=variables)
+
+    async def write_frame(self, project_id:str, scenario_id:str, data, edit_history:bool=False, trim:bool=True, baseline=None, tolerance:float=0.0, spans:bool=False):
+        async def write(variable:str, pl:dict, skipped:int):
+            if pl is None:
+                return variable, skipped
+            url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/data-series/{variable}/data/local'
+            return variable, (await self._request(url=url,method="put",payload=pl))[0]
+        changed = None
+        if baseline is not None:
+            if baseline is True:
+                baseline = await self.get_scenario_frame(project_id, scenario_id, data.columns, data.index)
+            changed = _changed_cells(data, baseline, tolerance, trim)
+        results = await asyncio.gather(*[write(*x) for x in _frame_payloads(data, edit_history, trim, changed, spans)])
+        return _write_report(results)
+
+    async def apply_frame(self, project_id:str, scenario_id:str, data, baseline=True, tolerance:float=0.0, push:bool=True, note:str=None, edit_history:bool=False, spans:bool=False):
+        # claims, writes and (optionally) pushes only the columns of data that differ from baseline
+        # (a DataFrame snapshot; None or True compares with the scenario's current data on the server)
+        if baseline is None or baseline is True:
+            baseline = await self.get_scenario_frame(project_id, scenario_id, data.columns, data.index)
+        data = _upper_columns(data)
+        changed = _changed_cells(data, baseline, tolerance)
+        variables = list(data.columns[changed.any(axis=0)])
+        if len(variables) > 0:
+            await self.claim(project_id, scenario_id, variables)
+        report = await self.write_frame(project_id, scenario_id, data, edit_history, baseline=baseline, tolerance=tolerance, spans=spans)
+        written = list(report.index[report['written']])
+        if push and len(written) > 0:
+            await self.push(project_id, scenario_id, written, note=note)
+        return report
+
+    async def edit_project_settings(self, project_id:str, edit_identities:bool=None, require_comments:bool=None, edit_equations:bool=None, allow_custom_variables:bool=None, databuffet_alias:str=None, edit_history:bool=None, edit_lasthist:bool=None):
+        pl = await self.get_project_info(project_id)
+        url = f'{self._base_uri}/project/{project_id}/settings'
+        if edit_identities is not None:
+            pl['varTypesLockStatus']['1'] = not edit_identities
+        if require_comments is not None:
+            pl['commentRequired'] = require_comments
+        if edit_equations is not None:
+            pl['allowEquationEditing'] = edit_equations
+        if allow_custom_variables is not None:
+            pl['allowCustomSeries'] = allow_custom_variables
+        if edit_history is not None:
+            pl['allowHistoryEditing'] = edit_history
+        if edit_lasthist is not None:
+            pl['allowLastHistoryChange'] = edit_lasthist
+        if databuffet_alias is not None:
+            pl['alias'] = f'S2PRJ_{databuffet_alias}'
+        ret = await self.request(url=url,method="put",payload=pl)
+        return ret
+
+    async def edit_scenario_settings(self, project_id:str, scenario_id:str, title:str=None, description:str=None, edit_start:int=None, forecast_end=None):
+        pl = await self.get_scenario_info(project_id, scenario_id)
+        if title is not None:
+            pl['title'] = title
+        if description is not None:
+            pl['description'] = description
+        if edit_start is not None:
+            pl['editStart'] = edit_start
+        if forecast_end is not None:
+            pl['forecastEnd'] = forecast_end
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}'
+        ret = await self.request(url=url,method="put",payload=pl)
+        return ret
+
+    async def search_series(self, project_id:str, scenario_ids:list=None, geos:list=None, state:int=None, local_state:int=None, query:str="", checked_out:int=None, variable_type:list=None, sharedown:bool=None, custom_series:bool=None, history_edits:bool=None, equation_edits:bool=None):
+        if scenario_ids is None:
+            scensInfo = await self.get_project_scenarios(project_id)
+            scenario_ids = [x['id'] for x in scensInfo]
+        pl = _search_series_payload(scenario_ids, geos, state, local_state, query, checked_out, variable_type, sharedown, custom_series, history_edits, equation_edits)
+        url = f'{self._base_uri}/project/{project_id}/search/count'
+        count = await self.request(url=url,method="post",payload=pl)
+        if count > 0:
+            url = f'{self._base_uri}/project/{project_id}/search/results?skip=0&take={count}'
+            ret = await self.request(url=url,method="post",payload=pl)
+        else:
+            ret = []
+        return ret
+
+    async def iter_search_series(self, project_id:str, scenario_ids:list=None, geos:list=None, state:int=None, local_state:int=None, query:str="", checked_out:int=None, variable_type:list=None, sharedown:bool=None, custom_series:bool=None, history_edits:bool=None, equation_edits:bool=None, page_size:int=1000, fields:list=None):
+        if scenario_ids is None:
+            scensInfo = await self.get_project_scenarios(project_id)
+            scenario_ids = [x['id'] for x in scensInfo]
+        pl = _search_series_payload(scenario_ids, geos, state, local_state, query, checked_out, variable_type, sharedown, custom_series, history_edits, equation_edits)
+        url = f'{self._base_uri}/project/{project_id}/search/count'
+        count = await self.request(url=url,method="post",payload=pl)
+        url = f'{self._base_uri}/project/{project_id}/search/results'
+        fetch = lambda skip, take: self.request(url=f'{url}?skip={skip}&take={take}',method="post",payload=pl)
+        async for x in self._iter_pages(fetch, count if type(count) is int else 0, page_size, fields):
+            yield x
+
+    async def get_sharedown_info(self, project_id:str, scenario_id:str, variable:str):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/{variable}/sharedown'
+        ret = await self._get_metadata(url)
+        return ret
+
+    async def sharedown_solve(self, project_id:str, scenario_id:str, variable:str):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/{variable}/sharedown'
+        ret = [await self.request(url=url,method="post")]
+        return ret
+
+    async def get_audits(self, project_id:str, scenario_ids:list=[],actions:list=[]):
+        url = f'{self._base_uri}/audit/project/{project_id}'
+        params = _audit_params(scenario_ids, actions)
+        if len(params) > 0:
+            url = f'{url}?{"&".join(params)}'
+        ret = await self.request(url=url,method="get")
+        return ret
+
+    async def audit_count(self, project_id:str, scenario_ids:list=[],actions:list=[]):
+        url = f'{self._base_uri}/audit/project/{project_id}/count'
+        params = _audit_params(scenario_ids, actions)
+        if len(params) > 0:
+            url = f'{url}?{"&".join(params)}'
+        ret = await self.request(url=url,method="get")
+        return ret
+
+    async def tail_audits(self, project_id:str, cursor:AuditCursor=None, scenario_ids:list=[], actions:list=[], page_size:int=500, from_start:bool=True, follow:float=None):
+        tail = _AuditTail(AuditCursor() if cursor is None else cursor, project_id, scenario_ids, actions, from_start)
+        url = f'{self._base_uri}/audit/project/{project_id}?{"".join(x + "&" for x in _audit_params(scenario_ids, actions))}'
+        fetch = lambda skip, take: self.request(url=f'{url}skip={skip}&take={take}',method="get")
+        try:
+            while True:
+                total = await self.audit_count(project_id, scenario_ids, actions)
+                if type(total) is not int:
+                    raise Exception(f'could not count audits for project {project_id}: {total}')
+                new = tail.start(total)
+                if new > 0 and tail.newest_first is None and total > 1:
+                    tail.order(*await asyncio.gather(fetch(0, 1), fetch(total - 1, 1)))
+                if new > 0 and tail.newest_first:
+                    records = []
+                    skip = 0
+                    while True:
+                        page = await fetch(skip, page_size)
+                        if type(page) is not list:
+                            raise Exception(f'audit page at skip={skip} of project {project_id} could not be read: {page}')
+                        if tail.collect(records, page, new) or len(page) < page_size:
+                            break
+                        skip += page_size
+                    while len(records) > 0:
+                        x = records.pop()
+                        tail.advance(x)
+                        yield x
+                elif new > 0:
+                    for skip in range(tail.position, total, page_size):
+                        page = await fetch(skip, page_size)
+                        if type(page) is not list:
+                            raise Exception(f'audit page at skip={skip} of project {project_id} could not be read: {page}')
+                        for x in page:
+                            if tail.advance(x):
+                                yield x
+                        if len(page) < page_size:
+                            break
+                tail.save()
+                if follow is None:
+                    return
+                await asyncio.sleep(follow)
+        finally:
+            tail.save()
+
+    async def get_pushed_series(self, project_id:str, scenario_id:str):
+        url = f'{self._base_uri}/audit/project/{project_id}?options.actions=4&options.scenarios={scenario_id}'
+        ret = await self.request(url=url,method="get")
+        return ret
+
+    async def set_user_permission(self, project_id:str, emails:list, role:int):
+        if self.user_directory.expired():
+            self.user_directory.load(await self.get_user_universe())
+        url = f'{self._base_uri}/project/{project_id}/contributor/{role}'
+        pl, unresolved = self.user_directory.contributors(emails, role)
+        if len(unresolved) > 0:
+            print(f'Users not found: {", ".join(unresolved)}')
+        ret = await self.request(url=url,method="put",payload=pl)
+        return ret
+
+    async def set_permissions(self, assignments):
+        if isinstance(assignments, pd.DataFrame):
+            assignments = assignments[['project_id','user','role']].itertuples(index=False)
+        if self.user_directory.expired():
+            self.user_directory.load(await self.get_user_universe())
+        groups = {}
+        for project_id, user, role in assignments:
+            groups.setdefault((project_id, int(role)), []).append(user)
+        unresolved = []
+        async def assign(project_id:str, role:int, users:list):
+            pl, missing = self.user_directory.contributors(users, role)
+            unresolved.extend(missing)
+            if len(pl) == 0:
+                return project_id, role, 0, 0
+            url = f'{self._base_uri}/project/{project_id}/contributor/{role}'
+            return project_id, role, len(pl), (await self._request(url=url,method="put",payload=pl))[0]
+        results = await asyncio.gather(*[assign(project_id, role, users) for (project_id, role), users in groups.items()])
+        report = pd.DataFrame(results, columns=['project_id','role','users','status']).set_index(['project_id','role'])
+        report['ok'] = (report['status'] == 200) | (report['status'] == 304)
+        return report, sorted(set(unresolved))
+
+    async def get_user_universe(self):
+        url = f'{self._base_uri}/group/client'
+        ret = await self._get_metadata(url)
+        return ret
+
+    async def edit_equation(self,project_id:str, scenario_id:str, variable:str, equation:str):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/{variable}/equation'
+        pl = "'"+urllib.parse.quote(equation.upper())+"'"
+        ret = await self.request(url=url,method="put",payload=pl)
+        return ret
+
+    async def clear_add_factors(self, project_id:str, scenario_id:str, variables:list):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/data-series/add-factor/local'
+        pl = [x.upper().strip()+"_A" for x in variables]
+        ret = await self.request(url=url,method="put",payload=pl)
+        return ret
+
+    async def add_custom_variable(self, project_id:str, scenario_id:str, variable:str, data, variable_type:int=0, equation:str=None, observed:str="AVERAGED", last_hist=None, title:str="", units:str="", source:str="", add_factor_type:int=2):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/custom'
+        pl = {}
+        pl['variable'] = variable
+        pl['observedAttribute'] = observed
+        pl['title'] = title
+        pl['units'] = units
+        pl['source'] = source
+        pl['startDate'] = self.date_int(data.index[0])
+        if last_hist is None:
+            pl['lastHistorical'] = self.date_int(data.index[data.notna()][-1])
+        else:
+            pl['lastHistorical'] = self.date_int(last_hist)
+        pl['equation'] = equation.upper()
+        pl['data'] = _encode_data(data)
+        pl['addFactorType'] = add_factor_type
+        pl['variableType'] = variable_type
+        ret = await self.request(url=url,method="post",payload=[pl])
+        return ret
+
+    async def set_lasthist(self, project_id:str, scenario_id:str, variable:str, lasthist: int):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/series/{variable}/historical/{lasthist}'
+        ret = await self.request(url=url,method="put")
+        return ret
+
+    async def import_from_scenario(self, project_id:str, scenario_id_to:str, scenario_id_from:str, claim:bool=True):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id_to}/transfer-series/order'
+        pl = {'sourceScenarioId':scenario_id_from, 'claim':claim}
+        ret = [await self.request(url=url,method="post",payload=pl)]
+        return ret
+
+    async def remove_scenario(self, project_id:str, scenario_alias:str):
+        url = f'{self._base_uri}/project/{project_id}/scenario/alias/{scenario_alias.lower().strip()}'
+        ret = await self.request(url=url,method="delete")
+        return ret
+
+    async def delete_project(self, project_id:str):
+        url = f'{self._base_uri}/project/{project_id}'
+        ret = await self.request(url=url,method="delete")
+        return ret
+
+    async def get_scenario_checkpoints(self, project_id:str, scenario_id:str):
+        url = f'{self._base_uri}/project/{project_id}/checkpoint/{scenario_id}'
+        ret = await self._get_metadata(url)
+        return ret
+
+    async def create_checkpoint(self, project_id:str, scenario_id:str, note:str=""):
+        url = f'{self._base_uri}/project/{project_id}/scenario/{scenario_id}/checkpoint'
+        pl = {'note':note}
+        ret = await self.request(url=url,method="post",payload=pl)
+        return ret
+
+    async def reendogenize_scenario(self, scenario_id:str, push:bool=False):
+        project_id = (await self.get_base_scenario_info(scenario_id))['projectOwner']
+        variables = await self.search_series(project_id,[scenario_id],state=6)
+        mnemonics = [x['variableId'] for x in variables]
+        if len(mnemonics) > 0:
+            await self.claim(project_id,scenario_id,mnemonics)
+            order = await self.add_factor_solve(project_id,scenario_id,mnemonics)
+            output = (await self.wait_for_orders(project_id,order))[0]['message']
+            if output.lower().strip() == 'success':
+                if push:
+                    await self.push(project_id,scenario_id,mnemonics,note='Reendogenize scenario')
+            else:
+                print('Add factor solve failed')
+        else:
+            print('No variables to reendogenize')
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk export of Scenario Studio projects to disk, resumable. Series are downloaded in chunks,
+concurrently, and each chunk is written with s2api.export_frame to
+
+    <out>/<project id>/<scenario alias>/<frequency>/<transformation>/part-00000/
+
+A journal in <out> records every chunk once it is on disk, so a crashed or killed run started
+again with the same config and --out picks up where it stopped.
+
+    python s2api_export.py config.json --out exports --workers 4
+    python s2api_export.py --project <id> --scenarios BL S1 --out exports
+
+config.json (every key but projects is optional):
+
+    {"projects": ["<project id>", ...] or {"<project id>": {<any key below, for that project>}},
+     "scenarios": ["BL", "S1"],          aliases or ids; default all scenarios of the project
+     "variables": ["FGDP$_US", ...],     default every variable of each scenario
+     "frequencies": [172, 204],          API frequency codes; default [172]
+     "transformations": [null, 1, "yoy"], null = levels, integers are API transformation codes,
+                                          names are s2api.transform() transformations of the levels
+     "start": null, "end": null,         API integer dates
+     "chunk_size": 1000, "batch": 100, "retries": 2, "format": "npy"}
+
+Keys are read from --access-key/--encryption-key or the S2_ACCESS_KEY/S2_ENCRYPTION_KEY
+environment variables.
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+import threading
+import concurrent.futures
+import pandas as pd
+import s2api
+
+_DEFAULTS = {'scenarios': None, 'variables': None, 'frequencies': [172], 'transformations': [None], 'start': None, 'end': None,
+             'chunk_size': 1000, 'batch': 100, 'retries': 2, 'format': 'npy'}
+_PLAN = 'plan.json'
+_JOURNAL = 'journal.jsonl'
+
+def load_config(path:str=None, projects:list=None, scenarios:list=None, variables:list=None):
+    # config file, with projects, scenarios and variables given on the command line taking precedence
+    config = {}
+    if path is not None:
+        with open(path) as f:
+            config = json.load(f)
+    if projects:
+        config['projects'] = projects
+    if scenarios:
+        config['scenarios'] = scenarios
+    if variables:
+        config['variables'] = variables
+    if not config.get('projects'):
+        raise Exception('nothing to export: give a config with projects or --project')
+    if type(config['projects']) is list:
+        config['projects'] = {x: {} for x in config['projects']}
+    for x in config.get('transformations', []):
+        if type(x) is str and x not in s2api._TRANSFORMATIONS:
+            raise Exception(f'transformations must be null, API codes or one of {s2api._TRANSFORMATIONS}')
+    return config
+
+def _settings(config:dict, project_id:str):
+    # project keys override the top level, which overrides the defaults
+    return dict(_DEFAULTS, **{k: v for k, v in config.items() if k != 'projects'}, **config['projects'][project_id])
+
+def _name(transformation):
+    return 'level' if transformation is None else str(transformation)
+
+def plan(api, config:dict):
+    # {'config', 'variables': {project id: {alias: [variables]}}}; listing the variables once
+    # and keeping them in the plan fixes the chunks for every later run
+    variables = {}
+    for project_id in config['projects']:
+        settings = _settings(config, project_id)
+        scenarios = api.get_project_scenarios(project_id)
+        if type(scenarios) is not list:
+            raise Exception(f'could not read the scenarios of project {project_id}')
+        aliases = {x['id']: x['alias'].upper().strip() for x in scenarios}
+        wanted = list(aliases) if settings['scenarios'] is None else settings['scenarios']
+        variables[project_id] = {}
+        for scenario in wanted:
+            if scenario in aliases:
+                scenario_id, alias = scenario, aliases[scenario]
+            else:
+                found = [k for k, v in aliases.items() if v == scenario.upper().strip()]
+                if len(found) == 0:
+                    raise Exception(f'project {project_id} has no scenario {scenario}')
+                scenario_id, alias = found[0], scenario.upper().strip()
+            if settings['variables'] is not None:
+                listing = [x.upper().strip() for x in settings['variables']]
+            else:
+                listing = [x.variableId for x in api.iter_search_series(project_id, scenario_ids=[scenario_id], fields=['variableId'])]
+            variables[project_id][alias] = sorted(set(listing))
+            print(f'{project_id} {alias}: {len(variables[project_id][alias])} variables', flush=True)
+    return {'config': config, 'variables': variables}
+
+def chunks(plan:dict):
+    # one entry per download: (project, alias, freq, API transformation, part, variables, outputs),
+    # where outputs maps each output directory (relative to --out) to its local transformation
+    ret = []
+    config = plan['config']
+    for project_id, scenarios in plan['variables'].items():
+        settings = _settings(config, project_id)
+        # local transformations share the level download
+        downloads = {}
+        for x in settings['transformations']:
+            downloads.setdefault(None if type(x) is str else x, []).append(x)
+        for alias, variables in scenarios.items():
+            for freq in settings['frequencies']:
+                for transformation, outputs in downloads.items():
+                    for part, i in enumerate(range(0, len(variables), settings['chunk_size'])):
+                        paths = {os.path.join(project_id, alias, str(freq), _name(x), f'part-{part:05d}'): x for x in outputs}
+                        ret.append((project_id, alias, freq, transformation, part, variables[i:i+settings['chunk_size']], paths))
+    return ret
+
+class ExportJournal:
+    # Append-only record of the chunk outputs written under `out`. Every line is one output,
+    # flushed to disk once its export_frame has finished, so a run killed at any point loses at
+    # most the chunks it was writing; a torn last line is ignored.
+    def __init__(self, out:str):
+        self.path = os.path.join(out, _JOURNAL)
+        self._out = out
+        self._lock = threading.Lock()
+        self.done = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.done[entry['path']] = entry
+        self._file = open(self.path, 'a')
+        # a run killed mid-line leaves a torn line; start the next entry on a line of its own
+        if not self._ends_with_newline():
+            self._file.write('\n')
+
+    def _ends_with_newline(self):
+        if self._file.tell() == 0:
+            return True
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def close(self):
+        self._file.close()
+
+    def finished(self, path:str, retry_failed:bool=False):
+        # journaled and still on disk (meta.json is the last file export_frame writes)
+        entry = self.done.get(path)
+        if entry is None or (retry_failed and len(entry['failed']) > 0):
+            return False
+        return os.path.exists(os.path.join(self._out, path, 'meta.json'))
+
+    def record(self, path:str, columns:int, failed:dict, seconds:float):
+        entry = {'path': path, 'columns': columns, 'failed': failed, 'seconds': round(seconds, 3), 'time': time.time()}
+        with self._lock:
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.done[path] = entry
+
+def export_chunk(api, out:str, chunk:tuple, settings:dict, journal:ExportJournal, retry_failed:bool=False):
+    # downloads one chunk and writes each of its outputs not yet on disk; returns
+    # (transformations written, failed series)
+    project_id, alias, freq, transformation, part, variables, paths = chunk
+    done = [k for k in paths if journal.finished(k, retry_failed)]
+    if len(done) == len(paths):
+        # series that failed when the chunk was written are still missing from it
+        return [], {k: v for x in done for k, v in journal.done[x]['failed'].items()}
+    paths = {k: v for k, v in paths.items() if k not in done}
+    start = time.perf_counter()
+    names = {f'{alias}.{x}': x for x in variables}
+    (data, info), failed = api.get_series_data(project_id, list(names), freq=freq, transformation=transformation, batch=settings['batch'],
+                                               start=settings['start'], end=settings['end'], retries=settings['retries'], as_frame=True, report=True)
+    failed = {names.get(k.upper().strip(), k): v for k, v in failed.items()}
+    if len(data.columns) == 0:
+        raise Exception(f'no series could be read ({len(failed)} failed)')
+    columns = [names.get(str(x).upper().strip(), str(x)) for x in data.columns]
+    data.columns = columns
+    info.index = pd.Index(columns, name='mnemonic')
+    for path, local in paths.items():
+        s2api.export_frame(os.path.join(out, path), data if type(local) is not str else s2api.transform(data, local, freq), info, settings['format'])
+        journal.record(path, len(columns), failed, time.perf_counter() - start)
+    return [_name(x) for x in paths.values()], failed
+
+def run(api, config:dict, out:str, workers:int=4, restart:bool=False, retry_failed:bool=False):
+    # exports everything in config under out; returns {'chunks', 'written', 'skipped', 'failed', 'errors'}
+    os.makedirs(out, exist_ok=True)
+    plan_path = os.path.join(out, _PLAN)
+    if restart:
+        for name in (_PLAN, _JOURNAL):
+            if os.path.exists(os.path.join(out, name)):
+                os.unlink(os.path.join(out, name))
+    if os.path.exists(plan_path):
+        with open(plan_path) as f:
+            saved = json.load(f)
+        if saved['config'] != json.loads(json.dumps(config)):
+            raise Exception(f'{out} holds an export of a different config; use another --out or --restart')
+        print(f'Resuming the export in {out}', flush=True)
+    else:
+        saved = plan(api, config)
+        s2api._replace_file(plan_path, lambda f: f.write(json.dumps(saved, indent=1).encode('utf-8')))
+    todo = chunks(saved)
+    journal = ExportJournal(out)
+    summary = {'chunks': len(todo), 'written': 0, 'skipped': 0, 'failed': {}, 'errors': {}}
+    count = [0]
+    lock = threading.Lock()
+
+    def work(chunk:tuple):
+        project_id, alias, freq, transformation, part = chunk[:5]
+        start = time.perf_counter()
+        try:
+            written, failed = export_chunk(api, out, chunk, _settings(saved['config'], project_id), journal, retry_failed)
+            error = None
+        except Exception as ex:
+            written, failed, error = [], {}, str(ex)
+        # named after the outputs written (all of the chunk's outputs when it failed)
+        outputs = written if len(written) > 0 else [_name(x) for x in chunk[6].values()]
+        label = f'{project_id}/{alias}/{freq}/{"+".join(outputs)}/part-{part:05d}'
+        with lock:
+            count[0] += 1
+            if error is not None:
+                summary['errors'][label] = error
+                status = f'error - {error}'
+            elif len(written) == 0:
+                summary['skipped'] += 1
+                status = 'already on disk'
+            else:
+                summary['written'] += len(written)
+                status = f'{len(chunk[5]) - len(failed)} series in {time.perf_counter() - start:.1f}s' + (f', {len(failed)} failed' if len(failed) > 0 else '')
+            summary['failed'].update({f'{project_id}/{alias}.{k}': v for k, v in failed.items()})
+            if len(written) > 0 or error is not None:
+                print(f'[{count[0]}/{len(todo)}] {label}: {status}', flush=True)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            list(pool.map(work, todo))
+    finally:
+        journal.close()
+    return summary
+
+def main(argv:list=None):
+    parser = argparse.ArgumentParser(description='Resumable bulk export of Scenario Studio projects')
+    parser.add_argument('config', nargs='?', default=None, help='json config of projects, scenarios, variables, frequencies and transformations')
+    parser.add_argument('--out', required=True, help='export directory; rerun with the same one to resume')
+    parser.add_argument('--project', nargs='+', default=None, help='project ids, instead of or on top of the config')
+    parser.add_argument('--scenarios', nargs='+', default=None, help='scenario aliases or ids (default: all)')
+    parser.add_argument('--variables', nargs='+', default=None, help='variables (default: all)')
+    parser.add_argument('--workers', type=int, default=4, help='chunks downloaded at once')
+    parser.add_argument('--restart', action='store_true', help='forget the plan and journal in --out and export everything again')
+    parser.add_argument('--retry-failed', action='store_true', help='download again chunks in which some series failed')
+    parser.add_argument('--access-key', default=os.environ.get('S2_ACCESS_KEY'))
+    parser.add_argument('--encryption-key', default=os.environ.get('S2_ENCRYPTION_KEY'))
+    parser.add_argument('--base-uri', default=None, help='API root, e.g. a local s2api_mock_server.py')
+    args = parser.parse_args(argv)
+    if args.access_key is None or args.encryption_key is None:
+        parser.error('give --access-key and --encryption-key or set S2_ACCESS_KEY and S2_ENCRYPTION_KEY')
+
+    kwargs = {} if args.base_uri is None else {'base_uri': args.base_uri}
+    start = time.perf_counter()
+    try:
+        config = load_config(args.config, args.project, args.scenarios, args.variables)
+        with s2api.ScenarioStudioAPI(args.access_key, args.encryption_key, pool_maxsize=max(10, args.workers), **kwargs) as api:
+            summary = run(api, config, args.out, args.workers, args.restart, args.retry_failed)
+    except Exception as ex:
+        print(f'Error - {ex}')
+        sys.exit(2)
+    print(f'{summary["written"]} outputs written, {summary["skipped"]} chunks already on disk, {len(summary["errors"])} chunks with errors, '
+          f'{len(summary["failed"])} series failed, {time.perf_counter() - start:.1f}s', flush=True)
+    for series, reason in list(summary['failed'].items())[:20]:
+        print(f'  {series}: {reason}')
+    if len(summary['errors']) > 0 or len(summary['failed']) > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
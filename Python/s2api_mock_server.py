@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Scenario Studio v2 API, serving synthetic projects for offline
+tests and benchmarks of s2api.py. Nothing leaves the machine.
+
+    python s2api_mock_server.py --port 8080 --series 5000 --periods 200
+
+then point the library at it:
+
+    api = s2api.ScenarioStudioAPI('key', 'secret', base_uri='http://127.0.0.1:8080/scenario-studio/v2')
+"""
+
+import json
+import gzip
+import time
+import random
+import uuid
+import threading
+import argparse
+import datetime
+import urllib.parse
+import numpy as np
+import pandas as pd
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+_FREQS = {128: 'M', 172: 'Q-DEC', 204: 'Y-DEC'}
+_PERIODS_PER_YEAR = {128: 12, 172: 4, 204: 1}
+_EPOCH = '1849-12-31'
+_MISSING = -3.4028234663852886E+38
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+class SyntheticProject:
+    # A project with one scenario per alias, each holding the same `series` variables of
+    # `periods` observations from `start` at frequency `freq`. Values are seeded random walks,
+    # and each scenario differs from the first by a small shift so that diffs are non-trivial.
+    def __init__(self, project_id:str=None, aliases:list=['BL','S1'], series:int=1000, periods:int=200, freq:int=172, start:str='1980-01-01', last_hist:int=None, seed:int=0):
+        self.id = project_id or str(uuid.uuid4())
+        self.title = f'Synthetic project ({series} series)'
+        self.freq = freq
+        self.start = pd.Period(start, _FREQS[freq])
+        self.periods = periods
+        self.last_hist = periods // 2 if last_hist is None else last_hist
+        self.variables = [f'V{i:06d}_US' for i in range(series)]
+        self._rows = {v: i for i, v in enumerate(self.variables)}
+        rng = np.random.default_rng(seed)
+        base = 100.0 + np.cumsum(rng.normal(0.0, 1.0, (series, periods)), axis=1)
+        self.scenarios = {}
+        for i, alias in enumerate(aliases):
+            scenario_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f'{self.id}/{alias.upper()}'))
+            self.scenarios[scenario_id] = {'id': scenario_id, 'alias': alias.upper(), 'title': f'Scenario {alias.upper()}',
+                                           'data': base + 0.5 * i, 'checkpoints': []}
+        self.audits = []
+        self._converted = {}
+        self._searches = {}
+        self._lock = threading.Lock()
+
+    def scenario_by_alias(self, alias:str):
+        for x in self.scenarios.values():
+            if x['alias'] == alias.upper():
+                return x
+        return None
+
+    def info(self):
+        return {'id': self.id, 'title': self.title, 'description': 'Generated by s2api_mock_server', 'tags': ['synthetic'], 'scenarios': len(self.scenarios)}
+
+    def scenario_info(self, scenario:dict):
+        return {'id': scenario['id'], 'alias': scenario['alias'], 'title': scenario['title'], 'projectId': self.id}
+
+    def audit(self, action:int, scenario_id:str, variables:list=None, note:str=None):
+        with self._lock:
+            self.audits.append({'id': len(self.audits) + 1, 'action': action, 'projectId': self.id, 'scenarioId': scenario_id,
+                                'variables': variables, 'note': note, 'user': 'mock', 'timestamp': _now()})
+
+    def _block(self, scenario:dict, freq:int):
+        # (values, first period) of a scenario at freq; lower frequencies are averages over complete periods, cached until the next write
+        if freq == self.freq:
+            return scenario['data'], self.start
+        key = (scenario['id'], freq)
+        if key not in self._converted:
+            target = pd.period_range(self.start, periods=self.periods, freq=_FREQS[self.freq]).asfreq(_FREQS[freq]).asi8
+            groups, ordinals = pd.factorize(target)
+            weights = np.zeros((self.periods, len(ordinals)))
+            weights[np.arange(self.periods), groups] = 1.0
+            sizes = weights.sum(axis=0)
+            keep = sizes == _PERIODS_PER_YEAR[self.freq] // _PERIODS_PER_YEAR[freq]
+            values = (scenario['data'] @ weights[:, keep]) / sizes[keep]
+            self._converted[key] = (values, pd.Period(ordinal=int(ordinals[keep][0]), freq=_FREQS[freq]))
+        return self._converted[key]
+
+    def series(self, expression:str, freq:int, start:int=None, end:int=None):
+        alias, _, variable = expression.upper().strip().partition('.')
+        scenario = self.scenario_by_alias(alias)
+        row = self._rows.get(variable)
+        if scenario is None or row is None:
+            return {'status': 'NOT FOUND', 'mnemonic': expression}
+        if freq not in _PERIODS_PER_YEAR or _PERIODS_PER_YEAR[self.freq] % _PERIODS_PER_YEAR[freq] != 0:
+            return {'status': f'CANNOT CONVERT TO FREQUENCY {freq}', 'mnemonic': expression}
+        block, first = self._block(scenario, freq)
+        values = block[row]
+        last_hist = (self.start + (self.last_hist - 1)).asfreq(_FREQS[freq])
+        epoch = pd.Period(_EPOCH, _FREQS[freq]).ordinal
+        lo = 0 if start is None else max(0, start - (first.ordinal - epoch))
+        hi = len(values) if end is None else min(len(values), end - (first.ordinal - epoch) + 1)
+        values = values[lo:max(lo, hi)]
+        return {'status': 'OK', 'mnemonic': expression,
+                'data': {'freqCode': freq, 'startDate': (first + lo).start_time.strftime('%Y-%m-%d'), 'periods': len(values),
+                         'data': np.where(np.isnan(values), _MISSING, values).tolist()},
+                'lastHistory': last_hist.start_time.strftime('%Y-%m-%d'), 'description': f'Synthetic series {variable}',
+                'geoCode': 'US', 'observedAttribute': 'AVERAGED'}
+
+    def write(self, scenario:dict, variable:str, pl:dict):
+        row = self._rows.get(variable.upper())
+        if row is None:
+            return 404
+        epoch = pd.Period(_EPOCH, _FREQS[self.freq]).ordinal
+        offset = int(pl['startDate']) - (self.start.ordinal - epoch)
+        values = np.asarray(pl['data'], dtype=np.float64)
+        values[np.abs(values) > 1.7e+38] = np.nan
+        lo, hi = max(0, offset), min(self.periods, offset + len(values))
+        if hi <= lo:
+            return 304
+        current = scenario['data'][row, lo:hi]
+        new = values[lo - offset:hi - offset]
+        if np.array_equal(current, new, equal_nan=True):
+            return 304
+        with self._lock:
+            scenario['data'][row, lo:hi] = new
+            self._converted = {k: v for k, v in self._converted.items() if k[0] != scenario['id']}
+        return 200
+
+    def search(self, pl:dict):
+        # results are kept per query so that paging through them stays cheap
+        query = str(pl.get('query') or '').upper()
+        ids = tuple(pl.get('scenarioId') or self.scenarios)
+        if (query, ids) not in self._searches:
+            ret = []
+            for scenario_id in ids:
+                if scenario_id not in self.scenarios:
+                    continue
+                for variable in self.variables:
+                    if query in variable:
+                        ret.append({'variableId': variable, 'scenarioId': scenario_id, 'title': f'Synthetic series {variable}',
+                                    'geoCode': 'US', 'variableType': 0, 'checkedOut': 1, 'state': 1})
+            self._searches[(query, ids)] = ret
+        return self._searches[(query, ids)]
+
+class MockScenarioStudio:
+    # Serves `projects` on host:port (port 0 picks a free one) under /scenario-studio/v2.
+    #   latency            seconds added to every response
+    #   series_latency     seconds added per series in a data-series request
+    #   solve_seconds      how long a solve or build order stays unfinished
+    #   rate_limit         requests per minute per client before answering 429 (None for no limit)
+    #   throttle_rate      fraction of requests answered with 429 at random
+    #   error_rate         fraction of requests answered with 500 at random
+    # counts holds the number of requests served per status.
+    def __init__(self, projects:list=None, host:str='127.0.0.1', port:int=0, latency:float=0.0, series_latency:float=0.0, solve_seconds:float=2.0,
+                 rate_limit:float=None, throttle_rate:float=0.0, error_rate:float=0.0, seed:int=0):
+        self.projects = {x.id: x for x in (projects if projects is not None else [SyntheticProject()])}
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.series_latency = series_latency
+        self.solve_seconds = solve_seconds
+        self.rate_limit = rate_limit
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.orders = {}
+        self.counts = {}
+        self._buckets = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_uri(self):
+        return f'http://{self.host}:{self.port}/scenario-studio/v2'
+
+    def start(self):
+        handler = type('Handler', (_Handler,), {'mock': self})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_uri
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _count(self, status:int):
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def _throttle(self, client:str):
+        # seconds to wait before retrying, or 0 when the request may proceed
+        with self._lock:
+            if self.throttle_rate > 0 and self._random.random() < self.throttle_rate:
+                return 1
+            if self.rate_limit is None:
+                return 0
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(client, (self.rate_limit, now))
+            tokens = min(self.rate_limit, tokens + (now - updated) * self.rate_limit / 60.0)
+            if tokens < 1.0:
+                self._buckets[client] = (tokens, now)
+                return max(1, int(np.ceil((1.0 - tokens) * 60.0 / self.rate_limit)))
+            self._buckets[client] = (tokens - 1.0, now)
+            return 0
+
+    def _fail(self):
+        with self._lock:
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def order(self, project_id:str, scenario_id:str, kind:str):
+        order_id = str(uuid.uuid4())
+        with self._lock:
+            self.orders[order_id] = {'orderId': order_id, 'projectId': project_id, 'scenarioId': scenario_id, 'type': kind, 'due': time.monotonic() + self.solve_seconds}
+        return {'orderId': order_id, 'projectId': project_id, 'scenarioId': scenario_id}
+
+    def order_status(self, order_id:str):
+        order = self.orders.get(order_id)
+        if order is None:
+            return None
+        finished = time.monotonic() >= order['due']
+        return {'orderId': order_id, 'projectId': order['projectId'], 'scenarioId': order['scenarioId'], 'type': order['type'],
+                'finished': finished, 'message': 'Success' if finished else 'Running'}
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out as separate writes; with Nagle on, each response waits out a delayed ACK
+    disable_nagle_algorithm = True
+    mock = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, obj, status:int=200, headers:dict=None):
+        # 204 and 304 responses carry no body (HTTP framing), so the connection stays reusable
+        body = b'' if status in (204, 304) else json.dumps(obj, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        if len(body) > 0:
+            self.send_header('Content-Type', 'application/json')
+        if len(body) > 1024 and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=1)
+            self.send_header('Content-Encoding', 'gzip')
+        for k, v in (headers or {}).items():
+            self.send_header(k, str(v))
+        if status not in (204, 304):
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.mock._count(status)
+
+    def _body(self):
+        n = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(n) if n > 0 else b''
+        if self.headers.get('Content-Encoding') == 'gzip':
+            raw = gzip.decompress(raw)
+        return json.loads(raw) if len(raw) > 0 else None
+
+    def do_GET(self):
+        self._dispatch('get')
+
+    def do_POST(self):
+        self._dispatch('post')
+
+    def do_PUT(self):
+        self._dispatch('put')
+
+    def do_DELETE(self):
+        self._dispatch('delete')
+
+    def _dispatch(self, verb:str):
+        url = urllib.parse.urlsplit(self.path)
+        self._params = urllib.parse.parse_qsl(url.query)
+        query = dict(self._params)
+        parts = [x for x in url.path.split('/') if x][2:] if url.path.startswith('/scenario-studio/v2') else [x for x in url.path.split('/') if x]
+        if parts[-2:] == ['oauth2', 'token']:
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            return self._send({'token_type': 'Bearer', 'access_token': uuid.uuid4().hex, 'expires_in': 3600})
+        try:
+            pl = self._body() if verb in ('post', 'put') else None
+        except ValueError:
+            return self._send({'message': 'Malformed request body'}, 400)
+        client = self.headers.get('Authorization') or self.headers.get('AccessKeyId')
+        if client is None:
+            return self._send({'message': 'Unauthorized'}, 401)
+        wait = self.mock._throttle(client)
+        if wait > 0:
+            return self._send({'message': 'Too many requests'}, 429, {'Retry-After': wait})
+        if self.mock._fail():
+            return self._send({'message': 'Injected server error'}, 500)
+        if self.mock.latency > 0:
+            time.sleep(self.mock.latency)
+        ret = self._route(verb, parts, query, pl)
+        if ret is None:
+            return self._send({'message': f'No route for {verb.upper()} {url.path}'}, 404)
+        status, obj = ret
+        self._send(obj, status)
+
+    def _route(self, verb:str, parts:list, query:dict, pl):
+        mock = self.mock
+        if parts == ['health']:
+            return 200, 'Healthy'
+        if parts == ['project'] and verb == 'get':
+            return 200, [x.info() for x in mock.projects.values()]
+        if parts[:2] == ['audit', 'project'] and len(parts) in (3, 4):
+            project = mock.projects.get(parts[2])
+            if project is None:
+                return 404, {'message': 'Project not found'}
+            audits = project.audits
+            scenarios = [v for k, v in self._params if k == 'options.scenarios']
+            actions = [int(v) for k, v in self._params if k == 'options.actions']
+            audits = [x for x in audits if (not scenarios or x['scenarioId'] in scenarios) and (not actions or x['action'] in actions)]
+            if parts[3:] == ['count']:
+                return 200, len(audits)
+            skip = int(query.get('skip', 0))
+            take = int(query.get('take', len(audits)))
+            return 200, audits[skip:skip+take]
+        if len(parts) < 2 or parts[0] != 'project' or parts[1] not in mock.projects:
+            return None
+        project = mock.projects[parts[1]]
+        rest = parts[2:]
+        if rest == [] and verb == 'get':
+            return 200, project.info()
+        if rest == ['scenario'] and verb == 'get':
+            return 200, [project.scenario_info(x) for x in project.scenarios.values()]
+        if rest == ['data-series'] and verb == 'post':
+            if mock.series_latency > 0:
+                time.sleep(mock.series_latency * len(pl))
+            freq = int(query.get('frequency', project.freq))
+            start = int(query['start']) if 'start' in query else None
+            end = int(query['end']) if 'end' in query else None
+            return 200, [project.series(x, freq, start, end) for x in pl]
+        if rest == ['search', 'count'] and verb == 'post':
+            return 200, len(project.search(pl or {}))
+        if rest == ['search', 'results'] and verb == 'post':
+            skip = int(query.get('skip', 0))
+            take = int(query.get('take', 50))
+            return 200, project.search(pl or {})[skip:skip+take]
+        if rest == ['series', 'checked-out'] and verb == 'get':
+            return 200, []
+        if rest[:1] == ['order'] and len(rest) in (2, 3) and verb == 'get':
+            status = mock.order_status(rest[1])
+            return (404, {'message': 'Order not found'}) if status is None else (200, status)
+        if rest == ['build'] and verb == 'post':
+            # the build endpoint answers with a list of orders, like the client expects
+            return 200, [mock.order(project.id, None, 'build')]
+        if rest[:1] == ['checkpoint'] and len(rest) == 2 and verb == 'get':
+            scenario = project.scenarios.get(rest[1])
+            return (404, {'message': 'Scenario not found'}) if scenario is None else (200, scenario['checkpoints'])
+        if len(rest) < 2 or rest[0] != 'scenario' or rest[1] not in project.scenarios:
+            return None
+        scenario = project.scenarios[rest[1]]
+        action = rest[2:]
+        if action == [] and verb == 'get':
+            return 200, project.scenario_info(scenario)
+        if action in (['solve', 'local'], ['solve', 'central']) and verb == 'post':
+            project.audit(5, scenario['id'])
+            return 200, mock.order(project.id, scenario['id'], action[1])
+        if action == ['series', 'checkout'] and verb == 'post':
+            project.audit(2, scenario['id'], pl)
+            return 200, True
+        if action == ['series', 'checkin'] and verb == 'post':
+            project.audit(3, scenario['id'], pl)
+            return 200, True
+        if action == ['series', 'commit'] and verb == 'post':
+            project.audit(4, scenario['id'], pl.get('variables'), pl.get('note'))
+            return 200, True
+        if action == ['checkpoint'] and verb == 'post':
+            checkpoint = {'id': str(uuid.uuid4()), 'scenarioId': scenario['id'], 'note': (pl or {}).get('note', ''), 'created': _now()}
+            scenario['checkpoints'].append(checkpoint)
+            project.audit(6, scenario['id'])
+            return 200, checkpoint
+        if len(action) == 4 and action[0] == 'data-series' and action[2:] == ['data', 'local'] and verb == 'put':
+            status = project.write(scenario, action[1], pl)
+            return status, (True if status != 404 else {'message': 'Variable not found'})
+        return None
+
+def main(argv:list=None):
+    parser = argparse.ArgumentParser(description='Local stand-in for the Scenario Studio v2 API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--projects', type=int, default=1)
+    parser.add_argument('--series', type=int, default=1000)
+    parser.add_argument('--periods', type=int, default=200)
+    parser.add_argument('--freq', type=int, default=172, choices=sorted(_FREQS))
+    parser.add_argument('--scenarios', default='BL,S1', help='comma separated scenario aliases')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--series-latency', type=float, default=0.0)
+    parser.add_argument('--solve-seconds', type=float, default=2.0)
+    parser.add_argument('--rate-limit', type=float, default=None, help='requests per minute per client')
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+    projects = [SyntheticProject(f'P{i}', args.scenarios.split(','), args.series, args.periods, args.freq, seed=i) for i in range(args.projects)]
+    mock = MockScenarioStudio(projects, args.host, args.port, args.latency, args.series_latency, args.solve_seconds, args.rate_limit, args.throttle_rate, args.error_rate)
+    mock.start()
+    print(f'Listening on {mock.base_uri}', flush=True)
+    for project in projects:
+        print(f'  project {project.id}: ' + ', '.join([f'{x["alias"]}={x["id"]}' for x in project.scenarios.values()]), flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Offline tests of s2api.py against s2api_mock_server.py. No keys or network access needed.
+
+    python -m pytest test_s2api_mock.py
+"""
+
+import asyncio
+import pytest
+import s2api
+from s2api_mock_server import MockScenarioStudio, SyntheticProject
+
+@pytest.fixture
+def slow_series():
+    # each series takes 0.1 s to serve, so a batch of 8 outlasts a 0.5 s read timeout but a batch of 4 does not
+    project = SyntheticProject(series=8, periods=20)
+    with MockScenarioStudio([project], series_latency=0.1) as mock:
+        yield mock, project
+
+def test_read_timeout_splits_batch(slow_series):
+    mock, project = slow_series
+    series = [f'BL.{x}' for x in project.variables]
+    with s2api.ScenarioStudioAPI('test', 'test', base_uri=mock.base_uri, timeout=(5, 0.5), backoff=0.01) as api:
+        data, failed = api.get_series_data(project.id, series, batch=8, report=True)
+    assert failed == {}
+    assert len(data) == 8
+
+def test_async_read_timeout_splits_batch(slow_series):
+    mock, project = slow_series
+    series = [f'BL.{x}' for x in project.variables]
+    async def fetch():
+        async with s2api.AsyncScenarioStudioAPI('test', 'test', base_uri=mock.base_uri, timeout=(5, 0.5), backoff=0.01) as api:
+            return await api.get_series_data(project.id, series, batch=8, report=True)
+    data, failed = asyncio.run(fetch())
+    assert failed == {}
+    assert len(data) == 8